@@ -1,21 +1,160 @@
+import io
+import json
 import os
-import re
-import shutil
+import time
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, UploadFile, File, Form, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-import pandas as pd
+from utils import (
+    PDF,
+    PDFFetcher,
+    ModelRegistry,
+    JobQueue,
+    JobWorkers,
+    EntityMasker,
+    AdmissionController,
+    BlockingExecutor,
+    Overloaded,
+)
+from utils.metrics import metrics
+from utils.pdf import extraction_pool, shutdown_extraction_pool
+
+
+# PDF extraction processes per server process. Every gunicorn worker starts its own, so
+# WEB_CONCURRENCY * PDF_WORKERS processes extract at once; the default shares the CPUs.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", 1)))))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 8))
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "./.cache/jobs.sqlite3")
+# Job workers are run with `python -m utils.jobs`; set JOB_WORKERS to also start them with a
+# single-process server. Never with gunicorn, which would start them in every worker.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 0))
+GITHUB_TOP_K = int(os.getenv("GITHUB_TOP_K", 5))
+# Seconds a synchronous ranking waits for its GitHub lookups; slower ones finish in the
+# background and only fill the cache. Jobs wait for every lookup.
+GITHUB_TIME_BUDGET = float(os.getenv("GITHUB_TIME_BUDGET", 1))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1") == "1"
+CANDIDATE_POOL_ENABLED = os.getenv("CANDIDATE_POOL_ENABLED", "1") == "1"
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", 2))
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", CPU_WORKERS))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 16))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 5))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", 20))
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", FETCH_MAX_CONNECTIONS))
+
+registry = ModelRegistry()
+fetcher = PDFFetcher(max_connections=FETCH_MAX_CONNECTIONS, per_host=FETCH_PER_HOST)
+job_queue = JobQueue(JOB_QUEUE_PATH)
+job_workers = JobWorkers(
+    JOB_QUEUE_PATH, JOB_WORKERS, pdf_workers=PDF_WORKERS, stop_timeout=float(os.getenv("JOB_STOP_TIMEOUT", 10))
+)
+# Blocking work (file IO, PyMuPDF, spaCy, torch, LanguageTool) runs on `executor`, never on
+# the event loop. `admission` caps the requests running the heavy pipelines at once and
+# rejects the rest with 429/503 once its queue is full.
+executor = BlockingExecutor(CPU_WORKERS, name="cpu")
+admission = AdmissionController(
+    "analysis",
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    retry_after=ADMISSION_RETRY_AFTER,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PRELOAD_MODELS:
+        registry.load()
+    else:
+        registry.check()
+    if PDF_WORKERS > 1:
+        extraction_pool(PDF_WORKERS)
+    if JOB_WORKERS:
+        job_workers.start()
+    yield
+    job_workers.stop()
+    executor.shutdown()
+    shutdown_extraction_pool()
+    registry.close()
+
+
+app = FastAPI(title="Resume Analysis Tool", lifespan=lifespan)
+app.mount("/static", StaticFiles(directory="static"), name="static")
+templates = Jinja2Templates(directory="templates")
 
-from utils import PDF, ResumeRanker, ResumeChecker
-from models import CustomNER, JobClassifier
+request_seconds = metrics.histogram(
+    "resume_analyzer_request_seconds", "Latency of HTTP requests", ("method", "route", "status")
+)
+requests_in_flight = metrics.gauge("resume_analyzer_requests_in_flight", "HTTP requests being handled")
+request_errors = metrics.counter(
+    "resume_analyzer_request_errors_total", "HTTP requests that raised an exception", ("method", "route")
+)
+
+
+def cache_metrics():
+    caches = {}
+    if registry.is_loaded("cache"):
+        caches["analysis"] = (registry.cache.hits, registry.cache.misses)
+    if registry.is_loaded("resume_checker"):
+        checker = registry.resume_checker
+        caches["grammar"] = (checker.grammar_cache_hits, checker.grammar_cache_misses)
+    return [
+        ("resume_analyzer_cache_hits_total", "counter", "Cache lookups that hit",
+         [({"cache": name}, hits) for name, (hits, _) in caches.items()]),
+        ("resume_analyzer_cache_misses_total", "counter", "Cache lookups that missed",
+         [({"cache": name}, misses) for name, (_, misses) in caches.items()]),
+        ("resume_analyzer_cache_hit_ratio", "gauge", "Share of cache lookups that hit",
+         [({"cache": name}, hits / (hits + misses) if hits + misses else 0.0) for name, (hits, misses) in caches.items()]),
+    ]
 
 
-app = FastAPI(title="Resume Analysis Tool")
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+metrics.register_collector(cache_metrics)
+
+
+def _route(request: Request) -> str:
+    route = request.scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    if not metrics.enabled:
+        return await call_next(request)
+
+    requests_in_flight.inc()
+    start = time.perf_counter()
+    with metrics.track_request() as timings:
+        try:
+            response = await call_next(request)
+        except Exception:
+            request_errors.inc(method=request.method, route=_route(request))
+            raise
+        finally:
+            requests_in_flight.dec()
+    elapsed = time.perf_counter() - start
+    request_seconds.observe(elapsed, method=request.method, route=_route(request), status=response.status_code)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing({**timings, "total": elapsed})
+    return response
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -33,18 +172,28 @@ def recruiter(request: Request):
     return templates.TemplateResponse(request=request, name="recruiter-home.html")
 
 
-@app.post("/jobseeker/report")
-async def resume_report(request: Request, file: UploadFile = File(...)):
-    os.mkdir("uploads")
-    with open(f"uploads/{file.filename}", "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    filename = f"./uploads/{file.filename}"
-    pdf_reader = PDF([f"{filename}"])
-
-    resume_text = [resume for resume in pdf_reader.process_pdf() if resume["status"]]
-    ner = [CustomNER().process_text(resume["text"]) for resume in resume_text][0]
-
-    job_role = JobClassifier().predict_job_role(resume_text[0]["text"])
+def build_report(filename: str, content: bytes) -> dict:
+    """
+    Extract, tag and check one resume. Blocking, run it on the executor.
+    """
+    pdf_reader = PDF([(filename, content)], cache=registry.cache)
+
+    resume_text = [resume for resume in pdf_reader.process_pdf(path_type="stream") if resume["status"]]
+    with metrics.timer("report.ner"):
+        ner = [
+            registry.cache.get_or_compute(
+                "ner", resume["digest"], registry.ner.version, lambda: registry.ner.process_text(resume["text"])
+            )
+            for resume in resume_text
+        ][0]
+
+    with metrics.timer("report.job_role"):
+        job_role = registry.cache.get_or_compute(
+            "job_role",
+            resume_text[0]["digest"],
+            registry.job_classifier.version,
+            lambda: registry.job_classifier.predict_job_role(resume_text[0]["text"]),
+        )
 
     links = " ".join(resume_text[0]["links"])
     stop_words = []
@@ -52,16 +201,38 @@ async def resume_report(request: Request, file: UploadFile = File(...)):
         if key in ["skill", "org", "per", "loc", "education", "deg"]:
             stop_words.extend(ner[key])
 
-    pattern = r"\b(?:" + "|".join(map(re.escape, stop_words)) + r")\b"
-    resume_text[0]["text"] = re.sub(pattern, "", resume_text[0]["text"])
+    with metrics.timer("report.mask_entities"):
+        resume_text[0]["text"] = EntityMasker(stop_words).mask(resume_text[0]["text"])
+
+    resume_health = registry.resume_checker.perform_all_checks(resume_text[0]["text"] + links)
+    return {"ner": ner, "job_role": job_role, "resume_health": resume_health}
+
+
+@app.post("/jobseeker/report")
+async def resume_report(request: Request, file: UploadFile = File(...)):
+    content = await file.read()
+    async with admission.slot():
+        report = await executor.run(build_report, file.filename, content)
+    return templates.TemplateResponse(request=request, name="job-seeker-report.html", context=report)
+
+
+def read_excel_links(content: bytes) -> list:
+    """
+    Read the resume links from the first column of an Excel sheet
+    """
+    import pandas as pd
+
+    return pd.read_excel(io.BytesIO(content)).iloc[:, 0].tolist()
 
-    resume_health = ResumeChecker().perform_all_checks(resume_text[0]["text"] + links)
-    shutil.rmtree("uploads")
-    return templates.TemplateResponse(
-        request=request,
-        name="job-seeker-report.html",
-        context={"ner": ner, "job_role": job_role, "resume_health": resume_health},
-    )
+
+def add_to_pool(resumes):
+    """
+    Keep ranked resumes in the candidate pool so later job descriptions can be matched
+    against them without uploading them again
+    """
+    if CANDIDATE_POOL_ENABLED:
+        index = registry.ann_index if registry.is_loaded("ann_index") else None
+        registry.resume_ranker.add_to_pool(registry.candidate_pool, resumes, index)
 
 
 def calculate_ranking(pdf_reader, job_description):
@@ -71,27 +242,85 @@ def calculate_ranking(pdf_reader, job_description):
         for resume in pdf_reader
         if not resume["status"]
     ]
-    ranking = ResumeRanker().get_similarity(job_description, resume_texts)
+    ranking = registry.resume_ranker.get_similarity(job_description, resume_texts)
+    registry.github_enricher.enrich(ranking, top_k=GITHUB_TOP_K, time_budget=GITHUB_TIME_BUDGET)
+    add_to_pool(resume_texts)
     return error_files, ranking
 
 
+def stream_ranking(job_description, documents, path_type):
+    """
+    Extract and rank resumes in small batches, yielding NDJSON lines as soon as each
+    candidate is scored: 'error' events for files that could not be read, 'candidate'
+    events with provisional scores and a final 'ranking' event, best match first.
+    """
+    errors = []
+    ranked = []
+
+    def resumes():
+        pdf_reader = PDF(documents, fetcher=fetcher, cache=registry.cache)
+        for resume in pdf_reader.iter_pdf(path_type=path_type, workers=PDF_WORKERS, batch_size=STREAM_BATCH_SIZE):
+            if resume["status"]:
+                ranked.append(resume)
+                yield resume
+            else:
+                errors.append([resume["filename"], resume["text"]])
+
+    reported = 0
+    ranker = registry.resume_ranker
+    for event, index, value in ranker.iter_similarity(job_description, resumes(), STREAM_BATCH_SIZE):
+        for filename, text in errors[reported:]:
+            yield json.dumps({"event": "error", "filename": filename, "text": text}) + "\n"
+        reported = len(errors)
+        if event == "candidate":
+            yield json.dumps({"event": "candidate", "index": index, **value}) + "\n"
+        else:
+            registry.github_enricher.enrich(value, top_k=GITHUB_TOP_K, time_budget=GITHUB_TIME_BUDGET)
+            ranking = [{"index": key, **candidate} for key, candidate in value.items()]
+            yield json.dumps({"event": "ranking", "ranking": ranking, "error": errors}) + "\n"
+            add_to_pool(ranked)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Streaming response holding an admission slot until it has been sent. The slot is
+    released when sending ends for any reason, also when the client disconnects before
+    the body iterator was ever started.
+    """
+
+    def __init__(self, content, slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+
+async def ranking_stream_response(job_description, documents, path_type) -> StreamingResponse:
+    slot = await admission.acquire()
+    return AdmittedStreamingResponse(
+        executor.iterate(stream_ranking(job_description, documents, path_type)),
+        slot,
+        media_type="application/x-ndjson",
+    )
+
+
 @app.post("/recruiter/match1")
 async def resume_ranking_pdf(
     request: Request,
     job_description: str = Form(...),
     pdf_file: list[UploadFile] = File(...),
 ):
-    os.mkdir("./uploads")
-    filenames = []
-    for file in pdf_file:
-        with open(f"uploads/{file.filename}", "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        filenames.append(f"./uploads/{file.filename}")
-
-    pdf_reader = PDF(filenames).process_pdf(path_type="file")
-    error_files, ranking = calculate_ranking(pdf_reader, job_description)
+    documents = [(file.filename, await file.read()) for file in pdf_file]
 
-    shutil.rmtree("uploads")
+    async with admission.slot():
+        pdf_reader = await PDF(documents, cache=registry.cache).aprocess_pdf(
+            path_type="stream", workers=PDF_WORKERS, executor=executor
+        )
+        error_files, ranking = await executor.run(calculate_ranking, pdf_reader, job_description)
 
     return templates.TemplateResponse(
         request=request,
@@ -109,16 +338,12 @@ async def resume_ranking_excel(
     if not excel_file:
         raise FileNotFoundError("Excel File not Uploaded")
 
-    os.mkdir("./uploads")
-    with open(f"uploads/{excel_file.filename}", "wb") as buffer:
-        shutil.copyfileobj(excel_file.file, buffer)
-        filename = f"./uploads/{excel_file.filename}"
-
-    files = pd.read_excel(filename).iloc[:, 0].tolist()
-    pdf_reader = PDF(files).process_pdf(path_type="url")
-    error_files, ranking = calculate_ranking(pdf_reader, job_description)
-
-    shutil.rmtree("uploads")
+    files = await executor.run(read_excel_links, await excel_file.read())
+    async with admission.slot():
+        pdf_reader = await PDF(files, fetcher=fetcher, cache=registry.cache).aprocess_pdf(
+            path_type="url", workers=PDF_WORKERS, executor=executor
+        )
+        error_files, ranking = await executor.run(calculate_ranking, pdf_reader, job_description)
 
     return templates.TemplateResponse(
         request=request,
@@ -131,17 +356,122 @@ async def resume_ranking_excel(
 async def resume_ranking_drive(
     request: Request,
     job_description: str = Form(...),
-    google_link: UploadFile = File(...),
+    google_link: str = Form(...),
 ):
     if not google_link:
         raise ValueError("Links not submitted")
     else:
         google_link = google_link.split(",")
-        pdf_reader = PDF(google_link).process_pdf(path_type="url")
-    error_files, ranking = calculate_ranking(pdf_reader, job_description)
+    async with admission.slot():
+        pdf_reader = await PDF(google_link, fetcher=fetcher, cache=registry.cache).aprocess_pdf(
+            path_type="url", workers=PDF_WORKERS, executor=executor
+        )
+        error_files, ranking = await executor.run(calculate_ranking, pdf_reader, job_description)
 
     return templates.TemplateResponse(
         request=request,
         name="recruiter-match.html",
         context={"ranking": ranking, "error": error_files},
     )
+
+
+@app.post("/recruiter/match1/stream")
+async def resume_ranking_pdf_stream(
+    job_description: str = Form(...),
+    pdf_file: list[UploadFile] = File(...),
+):
+    documents = [(file.filename, await file.read()) for file in pdf_file]
+    return await ranking_stream_response(job_description, documents, "stream")
+
+
+@app.post("/recruiter/match2/stream")
+async def resume_ranking_excel_stream(
+    job_description: str = Form(...),
+    excel_file: UploadFile = File(...),
+):
+    files = await executor.run(read_excel_links, await excel_file.read())
+    return await ranking_stream_response(job_description, files, "url")
+
+
+@app.post("/recruiter/match3/stream")
+async def resume_ranking_drive_stream(
+    job_description: str = Form(...),
+    google_link: str = Form(...),
+):
+    return await ranking_stream_response(job_description, google_link.split(","), "url")
+
+
+@app.post("/recruiter/report")
+async def ranking_report(request: Request):
+    """
+    Render the report of a ranking the page received from one of the stream endpoints
+    """
+    payload = await request.json()
+    ranking = {candidate.pop("index"): candidate for candidate in payload["ranking"]}
+    return templates.TemplateResponse(
+        request=request,
+        name="recruiter-match.html",
+        context={"ranking": ranking, "error": payload.get("error", [])},
+    )
+
+
+@app.post("/recruiter/pool")
+async def resume_ranking_pool(
+    request: Request,
+    job_description: str = Form(...),
+    top_k: int = Form(None),
+    approximate: bool = Form(False),
+):
+    async with admission.slot():
+        index = await executor.run(lambda: registry.ann_index) if approximate else None
+        ranking = await executor.run(
+            registry.resume_ranker.rank_pool, job_description, registry.candidate_pool, top_k, index
+        )
+
+    return templates.TemplateResponse(
+        request=request,
+        name="recruiter-match.html",
+        context={"ranking": ranking, "error": []},
+    )
+
+
+@app.post("/recruiter/jobs")
+async def submit_ranking_job(
+    job_description: str = Form(...),
+    pdf_file: list[UploadFile] = File(None),
+    excel_file: UploadFile = File(None),
+    google_link: str = Form(None),
+):
+    if pdf_file:
+        documents = [(file.filename, await file.read()) for file in pdf_file]
+        job_id = await executor.run(job_queue.submit, job_description, documents, "stream")
+    elif excel_file:
+        files = await executor.run(read_excel_links, await excel_file.read())
+        job_id = await executor.run(job_queue.submit, job_description, files, "url")
+    elif google_link:
+        job_id = await executor.run(job_queue.submit, job_description, google_link.split(","), "url")
+    else:
+        raise HTTPException(status_code=400, detail="No resumes submitted")
+    return {"job_id": job_id}
+
+
+@app.get("/recruiter/jobs/{job_id}")
+def ranking_job_status(job_id: str):
+    status = job_queue.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+@app.get("/recruiter/jobs/{job_id}/result")
+def ranking_job_result(request: Request, job_id: str):
+    result = job_queue.result(job_id)
+    if result is None:
+        if job_queue.status(job_id) is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail="Job has not finished")
+    return templates.TemplateResponse(
+        request=request,
+        name="recruiter-match.html",
+        context={"ranking": result["ranking"], "error": result["error"]},
+    )
@@ -0,0 +1,139 @@
+"""Benchmark reduced-precision resume embeddings against the fp32 baseline
+
+Every inference mode (fp32, dynamic int8) runs in its own process, so its load time,
+throughput and peak RSS are measured in isolation. Rank-correlation drift is the
+Spearman correlation between the fp32 scores of the resumes and the scores of each
+mode, averaged over a few job descriptions. The storage precisions of
+`CandidatePool` are compared the same way, starting from the fp32 embeddings.
+
+Usage:
+    python benchmarks/embedding_precision.py [--resumes tests/test_set] [--repeat 3] [--threads 4] [--json]
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import spearmanr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+JOB_DESCRIPTIONS = [
+    "Python developer with experience in machine learning, pandas and deploying models with FastAPI",
+    "Frontend web developer skilled in React, JavaScript, HTML and CSS",
+    "Data analyst with SQL, Excel and Power BI dashboards for business reporting",
+    "Embedded systems engineer working with C, microcontrollers and IoT devices",
+]
+
+
+def run_mode(quantize: bool, threads: int, resumes: list[str], repeat: int) -> dict:
+    """
+    Load the ranker in one precision mode and time the encoding of the resumes
+    """
+    from utils.resume_ranker import ResumeRanker
+
+    start = time.perf_counter()
+    ranker = ResumeRanker(quantize=quantize, threads=threads)
+    load_seconds = time.perf_counter() - start
+
+    ranker.resume_embeddings(resumes[:1])
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embeddings = ranker.resume_embeddings(resumes)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "load_seconds": round(load_seconds, 2),
+        "docs_per_second": round(len(resumes) / min(timings), 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "queries": ranker.model.encode(JOB_DESCRIPTIONS),
+        "embeddings": embeddings,
+    }
+
+
+def cosine_scores(queries: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return queries @ embeddings.T
+
+
+def rank_drift(baseline: np.ndarray, scores: np.ndarray) -> dict:
+    """
+    Compare per-query scores against the baseline scores
+    """
+    correlations = [spearmanr(expected, actual).statistic for expected, actual in zip(baseline, scores)]
+    return {
+        "spearman": round(float(np.mean(correlations)), 4),
+        "top1_agreement": round(float(np.mean(baseline.argmax(axis=1) == scores.argmax(axis=1))), 4),
+        "max_score_change": round(float(np.abs(baseline - scores).max() * 100), 3),
+    }
+
+
+def storage_drift(queries: np.ndarray, embeddings: np.ndarray, dtype: str) -> dict:
+    """
+    Store fp32 embeddings in a candidate pool of the given precision and compare its scores
+    """
+    from utils.candidate_pool import CandidatePool
+
+    ids = [str(number) for number in range(len(embeddings))]
+    with tempfile.TemporaryDirectory() as directory:
+        pool = CandidatePool(directory, dtype=dtype)
+        pool.add(ids, embeddings)
+        scores = np.array([[dict(pool.search(query))[candidate_id] for candidate_id in ids] for query in queries])
+        return {"bytes": pool.nbytes, **rank_drift(cosine_scores(queries, embeddings), scores)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reduced-precision resume embeddings")
+    parser.add_argument("--resumes", default=os.path.join("tests", "test_set"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    from utils.pdf import PDF
+
+    files = sorted(glob.glob(os.path.join(args.resumes, "*.pdf")))
+    resumes = [resume["text"] for resume in PDF(files).process_pdf(path_type="file") if resume["status"]]
+
+    context = multiprocessing.get_context("spawn")
+    modes = {}
+    for name, quantize in (("fp32", False), ("int8", True)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            modes[name] = executor.submit(run_mode, quantize, args.threads, resumes, args.repeat).result()
+
+    baseline = modes["fp32"]
+    baseline_scores = cosine_scores(baseline["queries"], baseline["embeddings"])
+    results = {"resumes": len(resumes), "inference": {}, "storage": {}}
+    for name, mode in modes.items():
+        results["inference"][name] = {
+            key: value for key, value in mode.items() if key not in ("queries", "embeddings")
+        }
+        results["inference"][name].update(
+            rank_drift(baseline_scores, cosine_scores(mode["queries"], mode["embeddings"]))
+        )
+        results["inference"][name]["speedup"] = round(mode["docs_per_second"] / baseline["docs_per_second"], 2)
+    for dtype in ("float32", "float16", "int8"):
+        results["storage"][dtype] = storage_drift(baseline["queries"], baseline["embeddings"], dtype)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{results['resumes']} resumes, {len(JOB_DESCRIPTIONS)} job descriptions\n")
+        for section, rows in (("inference", results["inference"]), ("storage", results["storage"])):
+            columns = list(next(iter(rows.values())))
+            print(f"{section:>10}  " + "  ".join(f"{column:>16}" for column in columns))
+            for name, row in rows.items():
+                print(f"{name:>10}  " + "  ".join(f"{row[column]!s:>16}" for column in columns))
+            print()
@@ -0,0 +1,78 @@
+"""Check that importing the app stays within an import-time budget
+
+Every module is imported in a fresh interpreter, `--repeat` times, and the fastest
+import is compared against the budget. The check also fails when an import pulls in
+one of the heavy dependencies, which must only be loaded with the model that needs them.
+
+Usage:
+    python benchmarks/import_time.py [--modules app utils.jobs] [--budget 1.5] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_SECONDS = 1.5
+
+HEAVY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "transformers",
+    "spacy",
+    "sklearn",
+    "nltk",
+    "language_tool_python",
+    "pandas",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    """
+    Import a module in fresh interpreters
+
+    Returns:
+        dict: Fastest import time in seconds and the heavy modules the import loaded
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {"seconds": round(min(run["seconds"] for run in runs), 3), "heavy": runs[0]["heavy"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of the app against a budget")
+    parser.add_argument("--modules", nargs="+", default=["app", "utils.jobs"])
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS, help="Maximum import time in seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {module: measure(module, args.repeat) for module in args.modules}
+    print(json.dumps(results, indent=2))
+
+    failures = []
+    for module, result in results.items():
+        if result["seconds"] > args.budget:
+            failures.append(f"import {module} took {result['seconds']}s, budget {args.budget}s")
+        if result["heavy"]:
+            failures.append(f"import {module} loaded {', '.join(result['heavy'])}")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
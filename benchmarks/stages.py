@@ -0,0 +1,267 @@
+"""Benchmark the pipeline stages on the resumes in tests/test_set
+
+The PDFs are replicated up to every requested batch size, and each stage is run on
+the real models: PDF extraction, NER, job role classification, every resume check
+and the ranker's encoding and scoring. Per-document stages report the latency of
+every document; batch stages report the latency of the whole batch over `--repeat`
+runs. Caches are disabled, so repeated documents are processed again.
+
+The results are printed (or written with `--output`) as JSON. With `--baseline`,
+they are compared against an earlier result and the script exits with status 1
+when any stage is slower, or any model loads slower, than the tolerance allows.
+
+Usage:
+    python benchmarks/stages.py [--batch-sizes 8 32] [--stages extract ner check] [--output results.json]
+    python benchmarks/stages.py --baseline results.json [--tolerance 0.2]
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+STAGES = ["extract", "ner", "job_role", "check", "rank"]
+JOB_DESCRIPTION = (
+    "Software engineer with Python, machine learning and web development experience, "
+    "comfortable with SQL, cloud deployment and working in agile teams"
+)
+
+
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def replicate(items: list, size: int) -> list:
+    return [items[number % len(items)] for number in range(size)]
+
+
+def summarise(latencies: list[float], items: int, seconds: float) -> dict:
+    """
+    Summarise the latencies of a stage in seconds
+
+    Args:
+        latencies (list): Latency of every timed call
+        items (int): Number of documents processed per run
+        seconds (float): Wall time of one run over all documents
+
+    Returns:
+        dict: Documents per second, p50/p95 latency in milliseconds and the peak RSS so far
+    """
+    return {
+        "items": items,
+        "throughput": round(items / max(seconds, 1e-9), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def per_document(fn, items: list) -> dict:
+    """
+    Time a stage document by document
+    """
+    fn(items[0])
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - start)
+    return summarise(latencies, len(items), sum(latencies))
+
+
+def per_batch(fn, items: list, repeat: int) -> dict:
+    """
+    Time a stage on the whole batch, `repeat` times
+    """
+    fn(items[:1])
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(items)
+        latencies.append(time.perf_counter() - start)
+    return summarise(latencies, len(items), float(np.median(latencies)))
+
+
+def load_models(stages: list[str]) -> tuple[dict, dict]:
+    """
+    Load the models the selected stages need, timing every load
+
+    Returns:
+        tuple: Loaded models and their load time in seconds, by name
+    """
+    start = time.perf_counter()
+    from models import CustomNER, JobClassifier
+    from utils.resume_check import ResumeChecker
+    from utils.resume_ranker import ResumeRanker
+    load_seconds = {"imports": time.perf_counter() - start}
+
+    factories = {}
+    if "ner" in stages or "rank" in stages:
+        factories["ner"] = CustomNER
+    if "job_role" in stages:
+        factories["job_classifier"] = JobClassifier
+    if "check" in stages:
+        factories["resume_checker"] = lambda: ResumeChecker(grammar_cache_size=0)
+    if "rank" in stages:
+        factories["resume_ranker"] = lambda: ResumeRanker(ner=models["ner"])
+
+    models = {}
+    for name, factory in factories.items():
+        start = time.perf_counter()
+        models[name] = factory()
+        load_seconds[name] = time.perf_counter() - start
+    return models, {name: round(seconds, 3) for name, seconds in load_seconds.items()}
+
+
+def run_stages(stages: list[str], documents: list, batch_sizes: list[int], repeat: int, pdf_workers: int) -> dict:
+    """
+    Load the models and time every selected stage at every batch size
+
+    Args:
+        stages (list): Stages to run - 'extract', 'ner', 'job_role', 'check', 'rank'
+        documents (list): (filename, content) tuples of the source PDFs
+        batch_sizes (list): Number of documents per run
+        repeat (int): Number of runs of the batch stages
+        pdf_workers (int): Number of extraction processes
+
+    Returns:
+        dict: Load times and stage results keyed by '<stage>@<batch size>'
+    """
+    from utils.pdf import PDF
+
+    models, load_seconds = load_models(stages)
+    texts = [resume["text"] for resume in PDF(documents).process_pdf(path_type="stream") if resume["status"]]
+    results = {}
+
+    for size in batch_sizes:
+        batch = replicate(texts, size)
+        timed = {}
+        if "extract" in stages:
+            timed["extract"] = per_batch(
+                lambda items: PDF(items).process_pdf(path_type="stream", workers=pdf_workers),
+                replicate(documents, size),
+                repeat,
+            )
+        if "ner" in stages:
+            timed["ner.process_text"] = per_document(models["ner"].process_text, batch)
+            timed["ner.process_texts"] = per_batch(models["ner"].process_texts, batch, repeat)
+        if "job_role" in stages:
+            timed["job_role.predict_job_role"] = per_document(models["job_classifier"].predict_job_role, batch)
+        if "check" in stages:
+            checker = models["resume_checker"]
+            analyses = {text: checker.analyse(text) for text in texts}
+            timed["check.analyse"] = per_document(checker.analyse, batch)
+            timed["check.grammar"] = per_document(checker.grammar_check, batch)
+            for check in ("check_action_verbs", "check_passive_language", "check_personal_pronouns"):
+                timed[f"check.{check[6:]}"] = per_document(
+                    lambda text, check=check: getattr(checker, check)(text, analyses[text]), batch
+                )
+            timed["check.digital_footprint_links"] = per_document(checker.check_digital_footprint_links, batch)
+            timed["check.references_section"] = per_document(checker.check_references_section, batch)
+            timed["check.perform_all_checks"] = per_document(checker.perform_all_checks, batch)
+        if "rank" in stages:
+            ranker = models["resume_ranker"]
+            resumes = [{"text": text, "links": []} for text in batch]
+            timed["rank.encode"] = per_batch(ranker.resume_embeddings, batch, repeat)
+            timed["rank.get_similarity"] = per_batch(
+                lambda items: ranker.get_similarity(JOB_DESCRIPTION, items), resumes, repeat
+            )
+        for name, result in timed.items():
+            results[f"{name}@{size}"] = result
+
+    if "resume_checker" in models:
+        models["resume_checker"].close()
+    return {"load_seconds": load_seconds, "stages": results, "peak_rss_mb": peak_rss_mb()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_ms: float) -> list[str]:
+    """
+    Find the stages and model loads that regressed against a baseline
+
+    Args:
+        results (dict): Current results
+        baseline (dict): Earlier results
+        tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20%
+        min_ms (float): Slowdowns of less than this many milliseconds per call or run are ignored as noise
+
+    Returns:
+        list: Description of every regression
+    """
+    regressions = []
+    for name, current in results["stages"].items():
+        previous = baseline["stages"].get(name)
+        if previous is None:
+            continue
+        slower_ms = (current["items"] / current["throughput"] - previous["items"] / previous["throughput"]) * 1000
+        if current["throughput"] < previous["throughput"] * (1 - tolerance) and slower_ms > min_ms:
+            regressions.append(f"{name}: throughput {current['throughput']} < {previous['throughput']}")
+        for metric in ("p50_ms", "p95_ms"):
+            if current[metric] > previous[metric] * (1 + tolerance) and current[metric] - previous[metric] > min_ms:
+                regressions.append(f"{name}: {metric} {current[metric]} > {previous[metric]}")
+    for name, seconds in results["load_seconds"].items():
+        previous = baseline["load_seconds"].get(name)
+        if previous is not None and seconds > previous * (1 + tolerance) and (seconds - previous) * 1000 > min_ms:
+            regressions.append(f"load {name}: {seconds}s > {previous}s")
+    if results["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(f"peak RSS: {results['peak_rss_mb']} MB > {baseline['peak_rss_mb']} MB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on tests/test_set")
+    parser.add_argument("--resumes", default=os.path.join("tests", "test_set"))
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[8, 32])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pdf-workers", type=int, default=1)
+    parser.add_argument("--output", help="Write the results to this JSON file instead of printing them")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    documents = []
+    for path in sorted(glob.glob(os.path.join(args.resumes, "*.pdf"))):
+        with open(path, "rb") as f:
+            documents.append((os.path.basename(path), f.read()))
+    if not documents:
+        sys.exit(f"No PDFs found in {args.resumes}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "documents": len(documents),
+            "batch_sizes": args.batch_sizes,
+            "repeat": args.repeat,
+        },
+        **run_stages(args.stages, documents, args.batch_sizes, args.repeat, args.pdf_workers),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.min_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}", file=sys.stderr)
@@ -0,0 +1,163 @@
+"""Measure the memory of every Gunicorn worker with and without preloading the models in the master
+
+For each mode the App is started with `gunicorn.conf.py`, and once it answers requests the
+resident (RSS) and proportional (PSS) set size of the master and each worker are read from
+/proc. RSS counts pages shared with other processes in full, PSS splits them between the
+processes sharing them, so the sum of PSS is what the server really costs. The processes
+each worker started (the PDF extraction pool with its forkserver, a LanguageTool JVM) are
+counted with it, however deep in the process tree they are. Linux only.
+
+Usage:
+    python benchmarks/worker_memory.py [--workers 4] [--modes fork per-worker] [--port 8765]
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "per-worker": {"PRELOAD_APP": "0"},
+    "fork": {"PRELOAD_APP": "1"},
+}
+
+
+def memory(pid: int) -> dict:
+    """
+    Read the memory of a process in MB
+
+    Returns:
+        dict: RSS, PSS, and the shared and private parts of the RSS
+    """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(fields["Rss"], 1),
+        "pss_mb": round(fields["Pss"], 1),
+        "shared_mb": round(fields["Shared_Clean"] + fields["Shared_Dirty"], 1),
+        "private_mb": round(fields["Private_Clean"] + fields["Private_Dirty"], 1),
+    }
+
+
+def children(pid: int) -> list:
+    """
+    Get the direct children of a process, started from any of its threads
+    """
+    found = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except FileNotFoundError:
+        return found
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                found.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            # The thread or the process exited meanwhile
+            pass
+    return found
+
+
+def descendants(pid: int) -> list:
+    """
+    Get every process below a process in the process tree
+    """
+    found = []
+    for child in children(pid):
+        found.append(child)
+        found.extend(descendants(child))
+    return found
+
+
+def tree_memory(pid: int) -> dict:
+    """
+    Read the memory of a process and of every process below it
+
+    Returns:
+        dict: Memory of the process, of each descendant, and the PSS of the whole tree in MB
+    """
+    own = memory(pid)
+    below = []
+    for child in descendants(pid):
+        try:
+            below.append({"pid": child, **memory(child)})
+        except FileNotFoundError:
+            pass
+    return {
+        **own,
+        "descendants": below,
+        "tree_pss_mb": round(own["pss_mb"] + sum(child["pss_mb"] for child in below), 1),
+    }
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, workers: int, master: int, timeout: float):
+    """
+    Wait until every worker is forked and the App answers requests
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                if len(children(master)) >= workers:
+                    return
+        except OSError:
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"App not ready after {timeout}s")
+
+
+def measure(mode: str, workers: int, port: int, timeout: float, settle: float) -> dict:
+    """
+    Start the App in one mode and measure the master and its workers
+    """
+    env = {**os.environ, **MODES[mode], "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "-c", "gunicorn.conf.py"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(f"http://127.0.0.1:{port}/", process, workers, process.pid, timeout)
+        # Give the workers that did not answer yet time to finish loading their models
+        time.sleep(settle)
+        worker_memory = [tree_memory(pid) for pid in children(process.pid)]
+        master_memory = memory(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+
+    return {
+        "master": master_memory,
+        "workers": worker_memory,
+        "worker_rss_mb_mean": round(sum(w["rss_mb"] for w in worker_memory) / len(worker_memory), 1),
+        "worker_pss_mb_mean": round(sum(w["pss_mb"] for w in worker_memory) / len(worker_memory), 1),
+        "worker_tree_pss_mb_mean": round(sum(w["tree_pss_mb"] for w in worker_memory) / len(worker_memory), 1),
+        "total_pss_mb": round(master_memory["pss_mb"] + sum(w["tree_pss_mb"] for w in worker_memory), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the per-worker memory of the server modes")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=["per-worker", "fork"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for the App to start")
+    parser.add_argument("--settle", type=float, default=10, help="Seconds to wait after the App answers")
+    args = parser.parse_args()
+
+    results = {mode: measure(mode, args.workers, args.port, args.timeout, args.settle) for mode in args.modes}
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,44 @@
+"""Gunicorn settings for serving the App with several worker processes
+
+    gunicorn app:app -c gunicorn.conf.py
+
+With PRELOAD_APP=1 (the default) the master imports the App and loads the NER models, the
+job classifier and the SentenceTransformer ranker once, then forks the workers, which share
+the weights copy-on-write instead of each loading its own copy. `gc.freeze()` moves every
+object created so far out of the collector's reach, so collections in the workers do not
+write to, and un-share, the pages holding them. LanguageTool, the thread pools and the SQLite
+connections are created in each worker after the fork; point LANGUAGE_TOOL_URL at one running
+LanguageTool server to share it between the workers as well.
+
+With PRELOAD_APP=0 every worker imports the App and loads all models itself.
+
+Job workers are never started by the web workers; run them with `python -m utils.jobs`.
+"""
+
+import gc
+import os
+
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+# Read by the App's lifespan, which runs once in every worker
+os.environ["JOB_WORKERS"] = "0"
+# Read by the App to split the CPUs between the workers' PDF extraction pools
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+
+def when_ready(server):
+    # Runs in the master after the App was imported and before any worker is forked
+    if not preload_app:
+        return
+    from app import registry, PRELOAD_MODELS
+
+    if PRELOAD_MODELS:
+        registry.preload()
+        server.log.info("Preloaded %s", ", ".join(registry.fork_safe))
+    gc.collect()
+    gc.freeze()
@@ -1,2 +1,25 @@
-from .job_classification.job_classification import JobClassifier
-from .ner.ner import CustomNER
\ No newline at end of file
+import importlib
+
+# Models are imported on first access, so that importing one does not load the
+# dependencies (spaCy, scikit-learn) of the other.
+_exports = {
+    "JobClassifier": ".job_classification.job_classification",
+    "CustomNER": ".ner.ner",
+}
+
+__all__ = list(_exports) + ["NER_BACKENDS"]
+
+# Model directory of each CustomNER backend, kept here so that it can be checked
+# without importing spaCy
+NER_BACKENDS = {
+    "accurate": "./models/ner/model-best",
+    "fast": "./models/ner/fast/model-best",
+}
+
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
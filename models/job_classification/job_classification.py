@@ -1,4 +1,69 @@
+import os
 import pickle
+import sys
+import tempfile
+import threading
+
+import joblib
+import numpy as np
+
+if __name__ == "__main__":
+    # Run as a file: make the repository root importable for `utils`
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from utils.metrics import metrics  # noqa: E402
+
+
+_loaded_models = {}
+_loaded_models_lock = threading.Lock()
+
+
+def load_model(model_file: str) -> tuple:
+    """
+    Load a (model, vectorizer) pair once per process
+
+    The pickle is converted to an uncompressed joblib file next to it on first use
+    (or by `python -m utils.bootstrap`), which is then memory-mapped on every later
+    load, so the large coefficient and vocabulary arrays are shared through the page
+    cache instead of being copied into each process. Where the directory is read-only,
+    the pickle is used as loaded.
+
+    Args:
+        model_file (str): Path of the pickle file
+
+    Returns:
+        tuple: Tuple containing the loaded model and vectorizer
+    """
+    joblib_file = os.path.splitext(model_file)[0] + ".joblib"
+    with _loaded_models_lock:
+        if model_file in _loaded_models:
+            return _loaded_models[model_file]
+        if not os.path.exists(joblib_file) or os.path.getmtime(joblib_file) < os.path.getmtime(model_file):
+            with open(model_file, "rb") as f:
+                loaded = pickle.load(f)
+            try:
+                _write_joblib(loaded, joblib_file)
+            except OSError:
+                _loaded_models[model_file] = tuple(loaded)
+                return _loaded_models[model_file]
+        _loaded_models[model_file] = tuple(joblib.load(joblib_file, mmap_mode="r"))
+        return _loaded_models[model_file]
+
+
+def _write_joblib(value, joblib_file: str):
+    """
+    Write a joblib file atomically. Every writer uses its own temporary file, so processes
+    converting the same model at once do not overwrite each other's partial files.
+    """
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(joblib_file) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            joblib.dump(value, f)
+        os.chmod(temp_file, 0o644)
+        os.replace(temp_file, joblib_file)
+    except BaseException:
+        os.remove(temp_file)
+        raise
 
 
 class JobClassifier:
@@ -22,17 +87,57 @@ class JobClassifier:
             34: "Web_Developer", 8: "Database_Administrator",
         }
         self.loaded_model, self.loaded_vectorizer = self._load_model()
+        model_stat = os.stat(self.model_file)
+        self.version = f"{model_stat.st_size}-{int(model_stat.st_mtime)}"
 
     def _load_model(self):
         """
-        Load the model and vectorizer from the pickle file
+        Load the model and vectorizer, shared by every instance in the process
 
         Returns:
             tuple: Tuple containing the loaded model and vectorizer
         """
-        with open(self.model_file, "rb") as f:
-            loaded_model, loaded_vectorizer = pickle.load(f)
-        return loaded_model, loaded_vectorizer
+        return load_model(self.model_file)
+
+    def _scores(self, vectorized_texts) -> np.ndarray:
+        """
+        Get a score per class for vectorized texts: probabilities when the model has them,
+        decision function values otherwise
+        """
+        if hasattr(self.loaded_model, "predict_proba"):
+            return self.loaded_model.predict_proba(vectorized_texts)
+        scores = self.loaded_model.decision_function(vectorized_texts)
+        if scores.ndim == 1:
+            scores = np.column_stack([-scores, scores])
+        return scores
+
+    @metrics.timed("job_classifier.predict")
+    def predict_job_roles(self, texts: list[str], top_k: int = None) -> list:
+        """
+        Predict the job role categories of a batch of texts with a single transform and predict call
+
+        Args:
+            texts (list): Input texts to classify
+            top_k (int): When given, return the `top_k` best categories of each text with their scores
+
+        Returns:
+            list: Predicted job role category per text, or lists of (category, score) tuples,
+                best first, when `top_k` is given
+        """
+        if not texts:
+            return []
+        vectorized_texts = self.loaded_vectorizer.transform(texts)
+        if top_k is None:
+            return [self.label_mapping[prediction] for prediction in self.loaded_model.predict(vectorized_texts)]
+
+        scores = self._scores(vectorized_texts)
+        top_k = min(top_k, scores.shape[1])
+        best = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+        classes = self.loaded_model.classes_
+        return [
+            [(self.label_mapping[classes[column]], round(float(row_scores[column]), 4)) for column in row]
+            for row, row_scores in zip(best, scores)
+        ]
 
     def predict_job_role(self, text: str) -> str:
         """
@@ -44,9 +149,7 @@ class JobClassifier:
         Returns:
             str: Predicted job role category
         """
-        vectorized_text = self.loaded_vectorizer.transform([text])
-        prediction = self.loaded_model.predict(vectorized_text)
-        return self.label_mapping[prediction[0]]
+        return self.predict_job_roles([text])[0]
 
 
 if __name__ == "__main__":
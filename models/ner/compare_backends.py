@@ -0,0 +1,91 @@
+"""This file is for comparing the accuracy and latency of the NER backends
+
+Both backends are scored on the dev corpus written by `train_fast.py`. The accurate
+model was trained before that split existed and may have seen some of its documents,
+so its scores are an upper bound.
+
+Usage:
+    python models/ner/compare_backends.py [--backends accurate fast] [--batch-size 16] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from spacy.tokens import DocBin
+from spacy.training import Example
+
+NER_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(NER_DIR))
+# Run as a file: the models and `utils` are imported from the repository root
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from models.ner.ner import CustomNER  # noqa: E402
+
+
+def evaluate(backend: str, corpus: str, batch_size: int = 16) -> dict:
+    """
+    Score a backend on an annotated corpus and time it
+
+    Args:
+        backend (str): NER backend
+        corpus (str): Path of the annotated .spacy corpus
+        batch_size (int): Number of texts per batch in the throughput run
+
+    Returns:
+        dict: Load time, entity precision/recall/F1, per-document latency and batch throughput
+    """
+    start = time.perf_counter()
+    ner = CustomNER(backend=backend)
+    load_seconds = time.perf_counter() - start
+
+    references = list(DocBin().from_disk(corpus).get_docs(ner.nlp.vocab))
+    texts = [doc.text for doc in references]
+    examples = [Example(ner.nlp.make_doc(doc.text), doc) for doc in references]
+    scores = ner.nlp.evaluate(examples, batch_size=batch_size)
+
+    ner.process_text(texts[0])
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        ner.process_text(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    start = time.perf_counter()
+    ner.process_texts(texts, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "ents_p": round(scores["ents_p"], 4),
+        "ents_r": round(scores["ents_r"], 4),
+        "ents_f": round(scores["ents_f"], 4),
+        "ents_per_type": {label: round(values["f"], 4) for label, values in (scores["ents_per_type"] or {}).items()},
+        "latency_ms_p50": round(statistics.median(latencies), 2),
+        "latency_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        "docs_per_second": round(len(texts) / batch_seconds, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the accuracy and latency of the NER backends")
+    parser.add_argument("--backends", nargs="+", default=list(CustomNER.backends))
+    parser.add_argument("--corpus", default=os.path.join(NER_DIR, "fast", "corpus", "dev.spacy"))
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = [evaluate(backend, args.corpus, args.batch_size) for backend in args.backends]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        columns = ["backend", "load_seconds", "ents_p", "ents_r", "ents_f", "latency_ms_p50", "latency_ms_p95", "docs_per_second"]
+        print("  ".join(f"{column:>15}" for column in columns))
+        for result in results:
+            print("  ".join(f"{result[column]!s:>15}" for column in columns))
@@ -1,25 +1,51 @@
+import os
+
 import spacy
 
+from models import NER_BACKENDS
+from utils.metrics import metrics
+
 class CustomNER:
     """
     Class for custom Named Entity Recognition (NER) using SpaCy.
+
+    Two backends are available: 'accurate', the transformer pipeline, and 'fast', a
+    tok2vec pipeline trained from the same data with `models/ner/train_fast.py` that
+    runs far cheaper on CPU at some cost in accuracy (see `models/ner/compare_backends.py`).
+    The 'fast' model is not shipped and is experimental until it has been measured.
     """
 
-    def __init__(self):
-        self.model_path = './models/ner/model-best'
+    backends = NER_BACKENDS
+
+    def __init__(self, backend: str = "accurate"):
+        """
+        Load the NER pipeline of a backend
+
+        Args:
+            backend (str): NER backend - 'accurate'(default), 'fast'
+        """
+        if backend not in self.backends:
+            raise ValueError(f"Unknown NER backend '{backend}', expected one of {list(self.backends)}")
+        self.backend = backend
+        self.model_path = self.backends[backend]
+        if backend == "fast" and not os.path.exists(self.model_path):
+            raise FileNotFoundError(
+                f"{self.model_path} not found. Train it with 'python models/ner/train_fast.py'"
+            )
         self.nlp = spacy.load(self.model_path)
+        trained = int(os.path.getmtime(os.path.join(self.model_path, "meta.json")))
+        self.version = f"{self.model_path}:{self.nlp.meta['name']}-{self.nlp.meta['version']}:{trained}"
 
-    def process_text(self, text: str) -> dict:
+    def _extract_entities(self, doc) -> dict:
         """
-        Process the input text with the custom NER model and extract entities
+        Group the entities of a processed document by their label
 
         Args:
-            text (str): Input text to be processed
+            doc (spacy.tokens.Doc): Document processed by the NER model
 
         Returns:
             dict: A dictionary containing recognized entities and their labels
         """
-        doc = self.nlp(text)
         entities = {}
         for ent in doc.ents:
             entities[ent.text] = ent.label_
@@ -28,3 +54,32 @@ class CustomNER:
             for key in set(entities.values())
         }
         return entities
+
+    @metrics.timed("ner.process_text")
+    def process_text(self, text: str) -> dict:
+        """
+        Process the input text with the custom NER model and extract entities
+
+        Args:
+            text (str): Input text to be processed
+
+        Returns:
+            dict: A dictionary containing recognized entities and their labels
+        """
+        return self._extract_entities(self.nlp(text))
+
+    @metrics.timed("ner.process_texts")
+    def process_texts(self, texts: list[str], batch_size: int = 16, n_process: int = 1) -> list[dict]:
+        """
+        Process several texts in one streamed pass through the NER model
+
+        Args:
+            texts (list): Input texts to be processed
+            batch_size (int): Number of texts sent through the pipeline together
+            n_process (int): Number of processes used by the pipeline
+
+        Returns:
+            list: Entity dictionaries, in the same order as the input texts
+        """
+        docs = self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+        return [self._extract_entities(doc) for doc in docs]
@@ -0,0 +1,65 @@
+"""This file is for training the fast CPU NER backend from the bundled train.spacy
+
+The annotated documents are shuffled with a fixed seed and split into a train and a
+dev corpus under 'models/ner/fast/corpus/', then 'models/ner/fast/config.cfg' (a
+tok2vec + ner pipeline) is trained on them. The best model is written to
+'models/ner/fast/model-best', where `CustomNER(backend="fast")` loads it from.
+
+Usage:
+    python models/ner/train_fast.py [--dev-fraction 0.1] [--seed 0] [--max-steps 20000]
+"""
+
+import argparse
+import os
+import random
+
+import spacy
+from spacy.cli.train import train
+from spacy.tokens import DocBin
+
+
+NER_DIR = os.path.dirname(os.path.abspath(__file__))
+FAST_DIR = os.path.join(NER_DIR, "fast")
+
+
+def split_corpus(source: str, output_dir: str, dev_fraction: float = 0.1, seed: int = 0) -> dict:
+    """
+    Split a .spacy corpus into a train and a dev corpus
+
+    Args:
+        source (str): Path of the annotated corpus
+        output_dir (str): Directory the 'train.spacy' and 'dev.spacy' files are written to
+        dev_fraction (float): Fraction of the documents held out for evaluation. Defaults to 0.1.
+        seed (int): Seed of the shuffle. Defaults to 0.
+
+    Returns:
+        dict: Paths of the written corpora under 'train' and 'dev'
+    """
+    nlp = spacy.blank("en")
+    docs = list(DocBin().from_disk(source).get_docs(nlp.vocab))
+    random.Random(seed).shuffle(docs)
+    n_dev = max(1, int(len(docs) * dev_fraction))
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for name, part in (("train", docs[n_dev:]), ("dev", docs[:n_dev])):
+        paths[name] = os.path.join(output_dir, f"{name}.spacy")
+        DocBin(docs=part).to_disk(paths[name])
+        print(f"{name}: {len(part)} documents -> {paths[name]}")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the fast tok2vec NER backend")
+    parser.add_argument("--source", default=os.path.join(NER_DIR, "train.spacy"))
+    parser.add_argument("--output", default=FAST_DIR)
+    parser.add_argument("--dev-fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-steps", type=int, default=None)
+    args = parser.parse_args()
+
+    corpus = split_corpus(args.source, os.path.join(args.output, "corpus"), args.dev_fraction, args.seed)
+    overrides = {"paths.train": corpus["train"], "paths.dev": corpus["dev"], "system.seed": args.seed}
+    if args.max_steps is not None:
+        overrides["training.max_steps"] = args.max_steps
+    train(os.path.join(FAST_DIR, "config.cfg"), output_path=args.output, overrides=overrides)
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from utils.admission import AdmissionController, Overloaded
+
+
+def test_slot_is_released_once():
+    async def scenario():
+        admission = AdmissionController("test", max_concurrent=1, max_queue=0, queue_timeout=0.1)
+        slot = await admission.acquire()
+        slot.release()
+        slot.release()
+        assert admission.active == 0
+
+        await admission.acquire()
+        # A second release of the first slot must not free the one now taken
+        slot.release()
+        with pytest.raises(Overloaded) as rejected:
+            await admission.acquire()
+        assert rejected.value.status_code == 429
+
+    asyncio.run(scenario())
+
+
+def test_stream_slot_is_released_when_the_client_leaves_before_the_body(monkeypatch, tmp_path):
+    monkeypatch.setenv("JOB_QUEUE_PATH", str(tmp_path / "jobs.sqlite3"))
+    import app
+
+    started = []
+
+    async def body():
+        started.append(True)
+        yield "line\n"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("Client disconnected")
+
+    async def scenario():
+        admission = AdmissionController("test", max_concurrent=1, max_queue=0)
+        response = app.AdmittedStreamingResponse(body(), await admission.acquire())
+        scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "method": "POST"}
+        with pytest.raises(Exception):
+            await response(scope, receive, send)
+        assert admission.active == 0
+        (await admission.acquire()).release()
+
+    asyncio.run(scenario())
+    assert not started
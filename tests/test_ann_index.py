@@ -0,0 +1,73 @@
+import numpy as np
+
+from utils.ann_index import IVFIndex
+from utils.candidate_pool import CandidatePool
+
+
+def random_embeddings(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, 16))
+
+
+def test_add_keeps_the_last_duplicate():
+    index = IVFIndex(n_lists=2, n_probe=2)
+    embeddings = np.eye(3, 16)
+    index.add(["a", "b", "a"], embeddings)
+
+    assert len(index) == 2
+    assert index.search(embeddings[2], 1)[0][0] == "a"
+    assert index.search(embeddings[0], 2)[1][1] < 0.5
+
+
+def test_index_started_empty_is_retrained_as_it_grows():
+    index = IVFIndex(n_probe=2)
+    index.add([f"first-{number}" for number in range(4)], random_embeddings(4))
+    assert index.trained_size == 4
+    assert len(index.centroids) == 2
+
+    embeddings = random_embeddings(400, seed=1)
+    ids = [f"new-{number}" for number in range(400)]
+    for start in range(0, 400, 50):
+        index.add(ids[start : start + 50], embeddings[start : start + 50])
+
+    assert len(index) == 404
+    assert index.trained_size > 200
+    assert len(index.centroids) == int(np.sqrt(index.trained_size))
+    assert index.search(embeddings[123], 1, n_probe=len(index.centroids))[0][0] == "new-123"
+
+
+def test_sync_follows_changes_of_the_pool(tmp_path):
+    pool = CandidatePool(str(tmp_path))
+    embeddings = random_embeddings(20)
+    pool.add([str(number) for number in range(10)], embeddings[:10])
+    index = IVFIndex.from_pool(pool, n_probe=8)
+
+    # Another process changes the pool
+    other = CandidatePool(str(tmp_path))
+    other.add([str(number) for number in range(10, 20)], embeddings[10:])
+    other.remove(["0", "1"])
+
+    index.sync(pool)
+    assert len(index) == 18
+    assert index.search(embeddings[15], 1, n_probe=100)[0][0] == "15"
+    assert "0" not in [candidate_id for candidate_id, _ in index.search(embeddings[0], 18, n_probe=100)]
+
+
+def test_sync_skips_an_unchanged_pool(tmp_path, monkeypatch):
+    pool = CandidatePool(str(tmp_path))
+    embeddings = random_embeddings(12)
+    pool.add([str(number) for number in range(10)], embeddings[:10])
+    index = IVFIndex.from_pool(pool)
+
+    snapshots = []
+    snapshot = pool.snapshot
+    monkeypatch.setattr(pool, "snapshot", lambda ids=None: snapshots.append(ids) or snapshot(ids))
+    index.sync(pool)
+    assert snapshots == []
+
+    # Changes of this process are seen as well as those of others
+    pool.add(["10"], embeddings[10:11])
+    index.sync(pool)
+    CandidatePool(str(tmp_path)).add(["11"], embeddings[11:12])
+    index.sync(pool)
+    assert snapshots == [["10"], ["11"]]
+    assert len(index) == 12
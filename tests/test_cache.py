@@ -0,0 +1,60 @@
+import sqlite3
+
+from utils.cache import AnalysisCache
+
+
+def test_versions_of_one_kind_do_not_evict_each_other(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = AnalysisCache(path, memory_items=0)
+    cache.set("ner", "doc", "accurate-1", {"skill": ["Python"]})
+    cache.set("ner", "doc", "fast-1", {"skill": ["SQL"]})
+
+    for _ in range(3):
+        assert cache.get("ner", "doc", "accurate-1") == {"skill": ["Python"]}
+        assert cache.get("ner", "doc", "fast-1") == {"skill": ["SQL"]}
+    assert cache.get("ner", "doc", "accurate-2") is None
+    assert (cache.hits, cache.misses) == (6, 1)
+
+
+def test_disk_hits_write_access_times_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = AnalysisCache(path, memory_items=0, touch_batch=3)
+    for key in "abc":
+        cache.set("extract", key, "1", key)
+
+    def accessed():
+        with sqlite3.connect(path) as db:
+            return dict(db.execute("SELECT key, accessed FROM entries").fetchall())
+
+    before = accessed()
+    cache.get("extract", "a", "1")
+    cache.get("extract", "b", "1")
+    assert accessed() == before
+    cache.get("extract", "c", "1")
+    assert all(accessed()[key] > before[key] for key in "abc")
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), memory_items=0, max_bytes=150, touch_batch=1)
+    cache.set("extract", "old", "1", "x" * 40)
+    cache.set("extract", "used", "1", "x" * 40)
+    cache.get("extract", "old", "1")
+    cache.set("extract", "new", "1", "x" * 40)
+
+    assert cache.get("extract", "used", "1") is None
+    assert cache.get("extract", "old", "1") == "x" * 40
+    assert cache.get("extract", "new", "1") == "x" * 40
+
+
+def test_rebuilds_files_keyed_without_version(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    with sqlite3.connect(path) as db:
+        db.execute(
+            "CREATE TABLE entries (kind TEXT, key TEXT, version TEXT, value BLOB, size INTEGER, accessed REAL, "
+            "PRIMARY KEY (kind, key))"
+        )
+    cache = AnalysisCache(path)
+    cache.set("ner", "doc", "1", "a")
+    cache.set("ner", "doc", "2", "b")
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 2
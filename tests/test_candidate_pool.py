@@ -0,0 +1,62 @@
+import json
+import multiprocessing
+
+import numpy as np
+
+from utils.candidate_pool import CandidatePool
+
+
+def add_candidates(directory, prefix, count):
+    pool = CandidatePool(str(directory))
+    rng = np.random.default_rng(len(prefix))
+    for number in range(count):
+        pool.add([f"{prefix}-{number}"], rng.normal(size=(1, 8)), [{"number": number}])
+
+
+def test_add_keeps_the_last_duplicate_and_its_metadata(tmp_path):
+    pool = CandidatePool(str(tmp_path))
+    embeddings = np.eye(3, 8)
+    pool.add(["a", "b", "a"], embeddings, [{"n": 0}, {"n": 1}, {"n": 2}])
+
+    assert pool.ids == ["a", "b"]
+    assert pool.get_metadata(["a", "b", "missing"]) == [{"n": 2}, {"n": 1}, None]
+    assert pool.search(embeddings[2], 1)[0][0] == "a"
+
+
+def test_remove_and_reopen(tmp_path):
+    pool = CandidatePool(str(tmp_path), dtype="int8")
+    embeddings = np.eye(4, 8)
+    pool.add(["a", "b", "c", "d"], embeddings)
+    pool.remove(["a", "unknown"])
+
+    reopened = CandidatePool(str(tmp_path))
+    assert reopened.dtype == "int8"
+    assert sorted(reopened.ids) == ["b", "c", "d"]
+    assert reopened.search(embeddings[3], 1)[0][0] == "d"
+
+
+def test_processes_share_the_pool(tmp_path):
+    pool = CandidatePool(str(tmp_path))
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=add_candidates, args=(tmp_path, prefix, 20)) for prefix in ("x", "yy", "zzz")]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert len(pool) == 60
+    assert len(pool.search(np.ones(8))) == 60
+    assert np.allclose(np.linalg.norm(pool.embeddings, axis=1), 1)
+
+
+def test_id_table_of_an_older_pool_is_imported(tmp_path):
+    (tmp_path / "ids.json").write_text(
+        json.dumps({"dim": 2, "dtype": "float32", "ids": ["x", "y"], "metadata": {"x": {"k": 1}}})
+    )
+    np.save(tmp_path / "embeddings.npy", np.array([[1, 0], [0, 1]], dtype=np.float32))
+
+    pool = CandidatePool(str(tmp_path))
+    assert pool.ids == ["x", "y"]
+    assert pool.get_metadata(["x", "y"]) == [{"k": 1}, None]
+    assert pool.search([1, 0.1], 1)[0][0] == "x"
+    assert not (tmp_path / "ids.json").exists()
@@ -0,0 +1,98 @@
+import asyncio
+
+import httpx
+
+from utils.fetcher import PDFFetcher
+
+
+def fetcher(handler, **kwargs) -> PDFFetcher:
+    return PDFFetcher(transport=httpx.MockTransport(handler), backoff=0, **kwargs)
+
+
+def test_results_keep_input_order():
+    async def handler(request):
+        number = int(request.url.params["n"])
+        # Later URLs finish first
+        await asyncio.sleep((5 - number) * 0.01)
+        return httpx.Response(200, content=f"pdf {number}".encode())
+
+    urls = [f"https://drive.google.com/uc?n={number}" for number in range(5)]
+    assert fetcher(handler).fetch_all_sync(urls) == [f"pdf {number}".encode() for number in range(5)]
+
+
+def test_retries_throttled_downloads_after_retry_after():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        if len(calls) < 3:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, content=b"pdf")
+
+    assert fetcher(handler).fetch_all_sync(["https://drive.google.com/uc?id=a"]) == [b"pdf"]
+    assert len(calls) == 3
+
+
+def test_retry_after_sets_the_delay():
+    response = httpx.Response(503, headers={"Retry-After": "7"})
+    assert PDFFetcher(backoff=0.5)._retry_delay(0, response) == 7.0
+    assert PDFFetcher(backoff=0.5)._retry_delay(2) == 2.0
+
+
+def test_gives_up_after_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(500)
+
+    [result] = fetcher(handler, retries=2).fetch_all_sync(["https://drive.google.com/uc?id=a"])
+    assert isinstance(result, httpx.HTTPStatusError)
+    assert len(calls) == 3
+
+
+def test_retries_transport_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, content=b"pdf")
+
+    assert fetcher(handler).fetch_all_sync(["https://drive.google.com/uc?id=a"]) == [b"pdf"]
+
+
+def test_max_bytes():
+    def handler(request):
+        if request.url.params["id"] == "declared":
+            return httpx.Response(200, content=b"x" * 100)
+        # No Content-Length, so the limit is enforced while streaming
+        return httpx.Response(200, stream=httpx.ByteStream(b"x" * 100), headers={"Transfer-Encoding": "chunked"})
+
+    results = fetcher(handler, max_bytes=50).fetch_all_sync(
+        ["https://drive.google.com/uc?id=declared", "https://drive.google.com/uc?id=streamed"]
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    assert fetcher(handler, max_bytes=100).fetch_all_sync(["https://drive.google.com/uc?id=declared"]) == [b"x" * 100]
+
+
+def test_downloads_from_one_host_run_concurrently():
+    running = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return httpx.Response(200, content=b"pdf")
+
+    urls = [f"https://drive.google.com/uc?id={number}" for number in range(16)]
+    assert fetcher(handler).fetch_all_sync(urls) == [b"pdf"] * 16
+    assert peak == 16
+
+    peak = 0
+    fetcher(handler, per_host=4).fetch_all_sync(urls)
+    assert peak == 4
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+
+import requests
+
+from utils.github_statistics import GitHubClient, GitHubEnricher
+
+USER = {"name": "Octo Cat", "followers": 3, "following": 1, "public_repos": 1}
+REPOS = [
+    {"name": "hello", "created_at": "2024-01-01T00:00:00Z", "description": None, "size": 10,
+     "language": "Python", "stargazers_count": 2},
+]
+
+
+class StubSession:
+    """
+    Stands in for requests.Session, answering from a handler and recording every request
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.headers = {}
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests.append((url, dict(headers or {})))
+        status, body, response_headers = self.handler(url, headers or {})
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(response_headers)
+        response._content = json.dumps(body).encode() if body is not None else b""
+        return response
+
+
+def github(url, headers):
+    if url.endswith("/repos"):
+        return 200, REPOS, {}
+    if url.endswith("/events"):
+        return 200, [], {}
+    if headers.get("If-None-Match") == '"v1"':
+        return 304, None, {"X-RateLimit-Remaining": "59"}
+    return 200, USER, {"ETag": '"v1"', "X-RateLimit-Remaining": "60"}
+
+
+def test_unchanged_resource_is_served_from_its_etag():
+    session = StubSession(github)
+    client = GitHubClient(session=session)
+
+    assert client.user("octocat") == (200, USER)
+    assert client.user("octocat") == (200, USER)
+
+    assert session.requests[0][1] == {}
+    assert session.requests[1][1] == {"If-None-Match": '"v1"'}
+    assert client.rate_limit_remaining == 59
+
+
+def test_no_request_is_sent_while_the_rate_limit_is_exhausted():
+    reset = str(time.time() + 60)
+
+    def exhausted(url, headers):
+        return 200, USER, {"ETag": '"v1"', "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}
+
+    session = StubSession(exhausted)
+    client = GitHubClient(session=session)
+    client.user("octocat")
+
+    assert client.rate_limited()
+    assert client.user("octocat") == (200, USER)
+    assert client.repos("octocat") == (403, {"message": "API rate limit exceeded"})
+    assert len(session.requests) == 1
+
+
+def test_rate_limit_is_lifted_after_its_reset():
+    def reset_passed(url, headers):
+        return 200, USER, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time.time() - 1)}
+
+    client = GitHubClient(session=StubSession(reset_passed))
+    client.user("octocat")
+
+    assert not client.rate_limited()
+
+
+def test_caches_keep_the_most_recently_used_entries():
+    session = StubSession(github)
+    client = GitHubClient(session=session, max_etags=2, max_users=2)
+
+    for username in ("a", "b", "a", "c"):
+        assert client.statistics(username)["name"] == "Octo Cat"
+
+    assert list(client._statistics) == ["a", "c"]
+    assert len(client._etags) == 2
+    before = len(session.requests)
+    client.statistics("a")
+    assert len(session.requests) == before
+
+
+def test_lookups_share_a_budget_that_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    session = StubSession(github)
+    # One lookup costs 2 + max_event_pages = 3 requests
+    client = GitHubClient(session=session, max_event_pages=1, request_budget=6, budget_refill_seconds=60)
+    enricher = GitHubEnricher(client=client)
+
+    ranking = {str(number): {"github": [f"user{number}"]} for number in range(3)}
+    enricher.enrich(ranking, top_k=3)
+    assert ["github_stats" in candidate for candidate in ranking.values()] == [True, True, False]
+
+    # The budget is spent across calls, not reset by each of them
+    assert client.statistics("user9") == {"Error": 429}
+    requests_sent = len(session.requests)
+    enricher.enrich({"9": {"github": ["user9"]}}, top_k=1)
+    assert len(session.requests) == requests_sent
+
+    now[0] += 30
+    assert client.budget.available == 3
+    candidate = {"github": ["user9"]}
+    enricher.enrich({"9": candidate}, top_k=1)
+    assert "github_stats" in candidate
+
+
+def test_lookups_over_the_time_budget_finish_in_the_background():
+    released = threading.Event()
+
+    def slow(url, headers):
+        released.wait(5)
+        return github(url, headers)
+
+    client = GitHubClient(session=StubSession(slow), max_event_pages=1)
+    enricher = GitHubEnricher(client=client)
+
+    candidate = {"github": ["octocat"]}
+    enricher.enrich({"0": candidate}, top_k=1, time_budget=0.05)
+    assert "github_stats" not in candidate
+
+    released.set()
+    for _ in range(100):
+        if client.cached_statistics("octocat") is not None:
+            break
+        time.sleep(0.05)
+    enricher.enrich({"0": candidate}, top_k=1, time_budget=0)
+    assert candidate["github_stats"]["name"] == "Octo Cat"
@@ -0,0 +1,15 @@
+import importlib.util
+
+import pytest
+
+from benchmarks.import_time import BUDGET_SECONDS, measure
+
+MISSING = [name for name in ("torch", "transformers", "spacy") if importlib.util.find_spec(name) is None]
+
+
+@pytest.mark.skipif(bool(MISSING), reason=f"{', '.join(MISSING)} not installed: a heavy import could not be detected")
+@pytest.mark.parametrize("module", ["app", "utils.jobs"])
+def test_import_stays_within_budget_and_light(module):
+    result = measure(module, repeat=3)
+    assert result["heavy"] == []
+    assert result["seconds"] <= BUDGET_SECONDS
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from models.job_classification import job_classification
+
+
+@pytest.fixture
+def model_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_classification, "_loaded_models", {})
+    texts = ["python developer django", "recruiting and payroll", "machine learning models"]
+    vectorizer = TfidfVectorizer().fit(texts)
+    model = LogisticRegression().fit(vectorizer.transform(texts), [25, 14, 6])
+    path = tmp_path / "job_role_model.pkl"
+    path.write_bytes(pickle.dumps((model, vectorizer)))
+    return str(path)
+
+
+def load_in_process(model_file):
+    job_classification.load_model(model_file)
+
+
+def test_pickle_is_converted_to_joblib(model_file):
+    model, vectorizer = job_classification.load_model(model_file)
+
+    assert model.predict(vectorizer.transform(["django developer"]))[0] == 25
+    assert sorted(os.listdir(os.path.dirname(model_file))) == ["job_role_model.joblib", "job_role_model.pkl"]
+
+
+def test_concurrent_conversions_do_not_clash(model_file):
+    # Forked, so the processes start converting at once instead of importing scikit-learn first
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=load_in_process, args=(model_file,)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0] * 4
+    assert sorted(os.listdir(os.path.dirname(model_file))) == ["job_role_model.joblib", "job_role_model.pkl"]
+    model, vectorizer = job_classification.load_model(model_file)
+    assert model.predict(vectorizer.transform(["payroll"]))[0] == 14
+
+
+def test_read_only_directory_uses_the_pickle(model_file, monkeypatch):
+    def read_only(*args, **kwargs):
+        raise PermissionError("Read-only file system")
+
+    monkeypatch.setattr(tempfile, "mkstemp", read_only)
+    model, vectorizer = job_classification.load_model(model_file)
+
+    assert model.predict(vectorizer.transform(["machine learning"]))[0] == 6
+    assert os.listdir(os.path.dirname(model_file)) == ["job_role_model.pkl"]
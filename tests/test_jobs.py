@@ -0,0 +1,70 @@
+import os
+import sqlite3
+
+from utils.jobs import JobQueue
+
+
+def dead_pid():
+    # A pid no process has: higher than the kernel allows
+    return 2**22 + 1
+
+
+def test_job_is_given_up_after_max_attempts(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+    job_id = queue.submit("python developer", [("resume.pdf", b"%PDF")], "stream")
+
+    for attempt in (1, 2):
+        job = queue.claim()
+        assert job["id"] == job_id and job["attempts"] == attempt
+        with sqlite3.connect(queue.path) as db:
+            db.execute("UPDATE jobs SET worker_pid = ? WHERE id = ?", (dead_pid(), job_id))
+        queue.requeue_stale()
+
+    status = queue.status(job_id)
+    assert status["status"] == "failed"
+    assert status["attempts"] == 2
+    assert queue.claim() is None
+    assert not os.path.exists(os.path.join(queue.files_dir, job_id))
+
+
+def test_fail_removes_the_uploaded_files(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.submit("python developer", [("resume.pdf", b"%PDF")], "stream")
+    assert os.listdir(os.path.join(queue.files_dir, job_id))
+
+    queue.fail(queue.claim()["id"], "Broken")
+    assert queue.status(job_id)["error"] == "Broken"
+    assert not os.path.exists(os.path.join(queue.files_dir, job_id))
+
+
+def test_queue_without_attempts_column_is_migrated(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    with sqlite3.connect(path) as db:
+        db.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, job_description TEXT NOT NULL, "
+            "path_type TEXT NOT NULL, documents TEXT NOT NULL, total INTEGER NOT NULL, done INTEGER NOT NULL DEFAULT 0, "
+            "result TEXT, error TEXT, worker_pid INTEGER, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        db.execute("INSERT INTO jobs VALUES ('old', 'queued', 'jd', 'url', '[]', 0, 0, NULL, NULL, NULL, 0, 0)")
+
+    queue = JobQueue(path)
+    assert queue.claim()["attempts"] == 1
+
+
+def test_running_jobs_are_requeued_when_stale_or_at_startup(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), stale_after=60)
+    stale_id = queue.submit("python developer", ["https://example.com/a.pdf"], "url")
+    fresh_id = queue.submit("python developer", ["https://example.com/b.pdf"], "url")
+    queue.claim()
+    queue.claim()
+    # Both claimed by this live process; only the first stopped sending heartbeats
+    with sqlite3.connect(queue.path) as db:
+        db.execute("UPDATE jobs SET updated = updated - 120 WHERE id = ?", (stale_id,))
+    queue.heartbeat(fresh_id)
+
+    queue.requeue_stale()
+    assert queue.status(stale_id)["status"] == "queued"
+    assert queue.status(fresh_id)["status"] == "running"
+
+    queue.requeue_running()
+    assert queue.status(fresh_id)["status"] == "queued"
@@ -0,0 +1,54 @@
+import glob
+import os
+import threading
+
+import httpx
+
+from utils.fetcher import PDFFetcher
+from utils.pdf import PDF
+
+TEST_SET = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "test_set", "*.pdf")))
+
+
+def drive_link(number: int) -> str:
+    return f"https://drive.google.com/file/d/{number:025d}/view"
+
+
+def test_iter_pdf_downloads_ahead_in_input_order():
+    contents = [open(path, "rb").read() for path in TEST_SET[:5]]
+    requested = set()
+    all_requested = threading.Event()
+
+    def handler(request):
+        number = int(request.url.params["id"])
+        requested.add(number)
+        if len(requested) == len(contents) + 1:
+            all_requested.set()
+        if number == len(contents):
+            return httpx.Response(404)
+        return httpx.Response(200, content=contents[number])
+
+    links = [drive_link(number) for number in range(len(contents) + 1)] + ["not a drive link"]
+    pdf = PDF(links, fetcher=PDFFetcher(transport=httpx.MockTransport(handler), backoff=0, retries=0))
+    results = pdf.iter_pdf(path_type="url", batch_size=2)
+
+    first = next(results)
+    # The first batch is extracted while every other link is already being downloaded
+    assert all_requested.wait(5)
+    results = [first, *results]
+
+    assert [result["status"] for result in results] == [True] * 5 + [False, False]
+    expected = PDF([(path, content) for path, content in zip(TEST_SET, contents)]).process_pdf(path_type="stream")
+    assert [result["text"] for result in results[:5]] == [result["text"] for result in expected]
+    assert results[6]["filename"] == "not a drive link"
+    assert pdf.output_text == results
+
+
+def test_iter_pdf_streams_in_memory_files_in_batches():
+    documents = [(os.path.basename(path), open(path, "rb").read()) for path in TEST_SET[:3]]
+    documents.append(("broken.pdf", b"not a pdf"))
+
+    results = list(PDF(documents).iter_pdf(path_type="stream", batch_size=3))
+
+    assert [result["status"] for result in results] == [True, True, True, False]
+    assert results[3]["filename"] == "broken.pdf"
@@ -1,4 +1,34 @@
-from .github_statistics import GitHubStatistics
-from .pdf import PDF
-from .resume_check import ResumeChecker
-from .resume_ranker import ResumeRanker
+import importlib
+
+# Classes are imported on first access, so importing one of them does not pull in the
+# heavy dependencies (torch, sentence-transformers, spaCy, nltk, LanguageTool) of the others.
+_exports = {
+    "AdmissionController": ".admission",
+    "BlockingExecutor": ".admission",
+    "Overloaded": ".admission",
+    "GitHubClient": ".github_statistics",
+    "GitHubEnricher": ".github_statistics",
+    "GitHubStatistics": ".github_statistics",
+    "IVFIndex": ".ann_index",
+    "AnalysisCache": ".cache",
+    "CandidatePool": ".candidate_pool",
+    "EntityMasker": ".entity_mask",
+    "PDFFetcher": ".fetcher",
+    "JobQueue": ".jobs",
+    "JobWorkers": ".jobs",
+    "MetricsRegistry": ".metrics",
+    "PDF": ".pdf",
+    "ResumeChecker": ".resume_check",
+    "ResumeRanker": ".resume_ranker",
+    "ModelRegistry": ".registry",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,191 @@
+"""This file is for keeping blocking work off the event loop and limiting concurrent requests"""
+
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from .metrics import metrics
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted. `status_code` is 429 when the queue is
+    full and 503 when the request waited longer than the queue timeout.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Slot:
+    """
+    A slot held by one request. Releasing it more than once has no effect, so it can be
+    released from every path that may end the request.
+    """
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    """
+    Class to limit how many requests run a heavy pipeline at once.
+
+    Up to `max_concurrent` requests run; up to `max_queue` more wait for a free slot,
+    for at most `queue_timeout` seconds. Anything beyond that is rejected straight
+    away, so under overload requests fail fast instead of piling up in the worker.
+    Must be used from a single event loop.
+
+    Args:
+        name (str): Name used as the 'controller' label of the metrics
+        max_concurrent (int): Number of requests running at once
+        max_queue (int): Number of requests allowed to wait for a slot
+        queue_timeout (float): Seconds a request may wait for a slot. Defaults to 30.
+        retry_after (int): Seconds clients are asked to wait before retrying. Defaults to 5.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float = 30.0, retry_after: int = 5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.waiting = 0
+        self.active = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+        self._queue_depth = metrics.gauge(
+            "resume_analyzer_admission_queue_depth", "Requests waiting for a slot", ("controller",)
+        )
+        self._active = metrics.gauge(
+            "resume_analyzer_admission_active", "Requests holding a slot", ("controller",)
+        )
+        self._wait_seconds = metrics.histogram(
+            "resume_analyzer_admission_wait_seconds", "Time requests waited for a slot", ("controller",)
+        )
+        self._rejected = metrics.counter(
+            "resume_analyzer_admission_rejected_total", "Requests rejected by admission control", ("controller", "reason")
+        )
+
+    def _reject(self, status_code: int, reason: str, detail: str):
+        self._rejected.inc(controller=self.name, reason=reason)
+        raise Overloaded(status_code, detail, self.retry_after)
+
+    async def acquire(self) -> Slot:
+        """
+        Wait for a slot
+
+        Returns:
+            Slot: The slot, to be released once the request is done
+
+        Raises:
+            Overloaded: If the queue is full (429) or no slot frees up in time (503)
+        """
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending, so the next caller sees it as taken
+            await self._semaphore.acquire()
+            self._wait_seconds.observe(0.0, controller=self.name)
+            return self._admitted()
+        if self.waiting >= self.max_queue:
+            self._reject(429, "queue_full", "Too many requests, try again later")
+
+        self.waiting += 1
+        self._queue_depth.set(self.waiting, controller=self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject(503, "timeout", "Server is busy, try again later")
+        finally:
+            self.waiting -= 1
+            self._queue_depth.set(self.waiting, controller=self.name)
+            self._wait_seconds.observe(time.perf_counter() - start, controller=self.name)
+        return self._admitted()
+
+    def _admitted(self) -> Slot:
+        self.active += 1
+        self._active.set(self.active, controller=self.name)
+        return Slot(self)
+
+    def _release(self):
+        self.active -= 1
+        self._active.set(self.active, controller=self.name)
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        slot = await self.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+
+class BlockingExecutor:
+    """
+    Class to run blocking calls (PDF parsing, model inference, LanguageTool) from async
+    code on a bounded thread pool, so they never run on the event loop.
+
+    The context of the caller is carried over to the thread, so stage timers still add
+    to the timing breakdown of the current request.
+
+    Args:
+        max_workers (int): Number of threads
+        name (str): Name used as the 'executor' label of the metrics. Defaults to 'blocking'.
+    """
+
+    def __init__(self, max_workers: int, name: str = "blocking"):
+        self.name = name
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._pending = metrics.gauge(
+            "resume_analyzer_executor_pending", "Blocking calls queued or running", ("executor",)
+        )
+        self._wait_seconds = metrics.histogram(
+            "resume_analyzer_executor_wait_seconds", "Time blocking calls waited for a thread", ("executor",)
+        )
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking function on the pool and wait for its result without blocking the event loop
+        """
+        submitted = time.perf_counter()
+
+        def call():
+            self._wait_seconds.observe(time.perf_counter() - submitted, executor=self.name)
+            return fn(*args, **kwargs)
+
+        context = contextvars.copy_context()
+        self.pending += 1
+        self._pending.set(self.pending, executor=self.name)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(context.run, call))
+        finally:
+            self.pending -= 1
+            self._pending.set(self.pending, executor=self.name)
+
+    async def iterate(self, iterator):
+        """
+        Drive a blocking iterator on the pool, yielding its items on the event loop
+        """
+        done = object()
+        while True:
+            item = await self.run(next, iterator, done)
+            if item is done:
+                return
+            yield item
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,244 @@
+"""This file is for approximate nearest neighbour search over resume embeddings"""
+
+import threading
+
+import numpy as np
+
+
+class IVFIndex:
+    """
+    Inverted file index for approximate top-k cosine similarity search.
+
+    The embeddings are clustered with spherical k-means into `n_lists` lists. A query
+    is scored against the list centroids first and then only against the embeddings
+    in the `n_probe` closest lists, so a query touches roughly `n_probe / n_lists`
+    of the pool. Raising `n_probe` trades latency for recall; `n_probe == n_lists`
+    is an exact search.
+
+    The clusters are trained on the embeddings indexed when the index is built. Once
+    `add` has grown the index to `retrain_factor` times that size, the clusters no
+    longer describe the data (an index started empty was trained on its first batch
+    alone), so the index is re-clustered from its current contents.
+
+    `synced_generation` is the `CandidatePool.generation` the index last matched, so that
+    `sync` only compares the index with its pool after the pool changed.
+
+    Args:
+        n_lists (int): Number of clusters. Defaults to the square root of the pool size.
+        n_probe (int): Number of clusters searched per query. Defaults to 8.
+        n_iter (int): Number of k-means iterations used by `build`. Defaults to 10.
+        seed (int): Seed for the k-means initialisation. Defaults to 0.
+        retrain_factor (float): Growth since the last training that triggers a `rebuild`. Defaults to 2.
+    """
+
+    def __init__(
+        self, n_lists: int = None, n_probe: int = 8, n_iter: int = 10, seed: int = 0, retrain_factor: float = 2.0
+    ):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.retrain_factor = retrain_factor
+        self.trained_size = 0
+        self.synced_generation = None
+        self.centroids = None
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+        self._lists = []
+        self._free = []
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @classmethod
+    def from_pool(cls, pool, **kwargs) -> "IVFIndex":
+        """
+        Build an index from the embeddings stored in a candidate pool
+
+        Args:
+            pool (CandidatePool): Pool to index
+            **kwargs: Arguments passed to the constructor
+
+        Returns:
+            IVFIndex: The built index
+        """
+        index = cls(**kwargs)
+        generation = pool.generation
+        index.build(*pool.snapshot())
+        index.synced_generation = generation
+        return index
+
+    def _normalise(self, embeddings) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def _nearest_list(self, embeddings: np.ndarray) -> np.ndarray:
+        return np.argmax(embeddings @ self.centroids.T, axis=1)
+
+    def build(self, ids: list[str], embeddings):
+        """
+        Cluster the embeddings and rebuild the index from scratch
+
+        Args:
+            ids (list): Candidate ids
+            embeddings (array-like): Embeddings, one row per id
+        """
+        if not len(ids):
+            with self._lock:
+                self.centroids = None
+                self.trained_size = 0
+                self._rows = {}
+            return
+        ids, embeddings = self._unique(ids, self._normalise(embeddings))
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(len(ids)))), len(ids))
+        rng = np.random.default_rng(self.seed)
+
+        centroids = embeddings[rng.choice(len(ids), n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignment = np.argmax(embeddings @ centroids.T, axis=1)
+            for cluster in range(n_lists):
+                members = embeddings[assignment == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+                else:
+                    centroids[cluster] = embeddings[rng.integers(len(ids))]
+            centroids = self._normalise(centroids)
+
+        with self._lock:
+            self.centroids = centroids
+            self.trained_size = len(ids)
+            self._vectors = np.empty((0, embeddings.shape[1]), dtype=np.float32)
+            self._ids = []
+            self._rows = {}
+            self._lists = [[] for _ in range(n_lists)]
+            self._free = []
+            self.add(ids, embeddings)
+
+    @staticmethod
+    def _unique(ids: list[str], embeddings: np.ndarray) -> tuple[list[str], np.ndarray]:
+        """
+        Drop repeated ids, keeping the last embedding given for each
+        """
+        positions = {candidate_id: position for position, candidate_id in enumerate(ids)}
+        if len(positions) == len(ids):
+            return list(ids), embeddings
+        return list(positions), embeddings[list(positions.values())]
+
+    def rebuild(self):
+        """
+        Re-cluster the index from the embeddings it currently holds
+        """
+        with self._lock:
+            ids = list(self._rows)
+            embeddings = self._vectors[[row for row, _ in self._rows.values()]]
+            self.build(ids, embeddings)
+
+    def add(self, ids: list[str], embeddings):
+        """
+        Insert embeddings into their closest list, replacing ids that are already indexed.
+        The index is re-clustered once it has grown `retrain_factor` times since it was trained.
+
+        Args:
+            ids (list): Candidate ids. When an id is given twice, its last embedding is kept.
+            embeddings (array-like): Embeddings, one row per id
+        """
+        if not len(ids):
+            return
+        ids, embeddings = self._unique(ids, self._normalise(embeddings))
+        with self._lock:
+            if self.centroids is None:
+                self.build(ids, embeddings)
+                return
+            self.remove(ids)
+            needed = len(ids) - len(self._free)
+            if needed > 0:
+                start = len(self._vectors)
+                grow = max(needed, start)
+                self._vectors = np.concatenate(
+                    [self._vectors, np.empty((grow, self._vectors.shape[1]), dtype=np.float32)]
+                )
+                self._ids.extend([None] * grow)
+                self._free.extend(range(start + grow - 1, start - 1, -1))
+            for candidate_id, embedding, cluster in zip(ids, embeddings, self._nearest_list(embeddings)):
+                row = self._free.pop()
+                self._vectors[row] = embedding
+                self._ids[row] = candidate_id
+                self._rows[candidate_id] = (row, cluster)
+                self._lists[cluster].append(row)
+            if len(self._rows) > self.retrain_factor * self.trained_size:
+                self.rebuild()
+
+    def sync(self, pool):
+        """
+        Bring the index up to date with a candidate pool that was changed after it was built,
+        e.g. by another process. Nothing is compared while the pool's generation is the
+        one last synced.
+
+        Args:
+            pool (CandidatePool): Pool the index was built from
+        """
+        # Read first: a change made while syncing leaves a newer generation, synced next time
+        generation = pool.generation
+        if generation == self.synced_generation:
+            return
+        ids = pool.ids
+        with self._lock:
+            indexed = set(self._rows)
+            stale = indexed.difference(ids)
+            missing = [candidate_id for candidate_id in ids if candidate_id not in indexed]
+            self.remove(list(stale))
+        if missing:
+            self.add(*pool.snapshot(missing))
+        self.synced_generation = generation
+
+    def remove(self, ids: list[str]):
+        """
+        Remove ids from the index. Their rows are reused by later inserts.
+
+        Args:
+            ids (list): Candidate ids to remove
+        """
+        with self._lock:
+            for candidate_id in ids:
+                entry = self._rows.pop(candidate_id, None)
+                if entry is None:
+                    continue
+                row, cluster = entry
+                self._lists[cluster].remove(row)
+                self._ids[row] = None
+                self._free.append(row)
+
+    def search(self, query, top_k: int = 10, n_probe: int = None) -> list[tuple[str, float]]:
+        """
+        Find the approximate top-k candidates for a query embedding
+
+        Args:
+            query (array-like): Embedding of the job description
+            top_k (int): Number of candidates to return. Defaults to 10.
+            n_probe (int): Number of clusters to search. Defaults to the index setting.
+
+        Returns:
+            list: Tuples of candidate id and cosine similarity, best first
+        """
+        query = self._normalise([query])[0]
+        with self._lock:
+            if not self._rows:
+                return []
+            n_probe = min(n_probe or self.n_probe, len(self._lists))
+            centroid_scores = self.centroids @ query
+            probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+            rows = np.fromiter(
+                (row for cluster in probed for row in self._lists[cluster]), dtype=np.int64
+            )
+            scores = self._vectors[rows] @ query
+            ids = [self._ids[row] for row in rows]
+
+        if top_k < len(scores):
+            best = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(ids[i], float(scores[i])) for i in best]
@@ -0,0 +1,149 @@
+"""This file is for vendoring the NLTK, LanguageTool and SentenceTransformer assets for offline use
+
+Run once, e.g. while building an image, to download everything the app would otherwise
+fetch at runtime into one directory, and to convert the job classifier for memory-mapping:
+
+    python -m utils.bootstrap [--assets-dir ./assets] [--model bert-base-nli-mean-tokens]
+
+`ResumeChecker` and `ResumeRanker` pick the vendored assets up from ASSETS_DIR
+(default './assets') when they exist. With ASSETS_OFFLINE=1, missing assets raise an
+error instead of being downloaded.
+"""
+
+import argparse
+import os
+import re
+
+
+ASSETS_DIR = os.getenv("ASSETS_DIR", "./assets")
+NLTK_PACKAGES = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    "averaged_perceptron_tagger_eng": "taggers/averaged_perceptron_tagger_eng",
+}
+
+# NLTK 3.8.2 moved `sent_tokenize` to the pickle-free 'punkt_tab' and `pos_tag` to the
+# English-only 'averaged_perceptron_tagger_eng'; older releases load the original packages
+LEGACY_NLTK_PACKAGES = ["punkt", "averaged_perceptron_tagger"]
+CURRENT_NLTK_PACKAGES = ["punkt_tab", "averaged_perceptron_tagger_eng"]
+
+
+def required_nltk_packages(version: str) -> list:
+    """
+    Get the NLTK packages the tokenizer and tagger of an NLTK release load
+
+    Args:
+        version (str): NLTK version, e.g. '3.9.1'
+
+    Returns:
+        list: Names of the required packages
+    """
+    release = tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+    return CURRENT_NLTK_PACKAGES if release >= (3, 8, 2) else LEGACY_NLTK_PACKAGES
+
+
+def offline() -> bool:
+    return os.getenv("ASSETS_OFFLINE", "0") == "1"
+
+
+def nltk_dir(assets_dir: str = ASSETS_DIR) -> str:
+    return os.path.join(assets_dir, "nltk_data")
+
+
+def language_tool_dir(assets_dir: str = ASSETS_DIR) -> str:
+    return os.path.join(assets_dir, "language_tool")
+
+
+def sentence_transformer_dir(model_name: str, assets_dir: str = ASSETS_DIR) -> str:
+    return os.path.join(assets_dir, "sentence_transformers", model_name.replace("/", "__"))
+
+
+def sentence_transformer_path(model_name: str, assets_dir: str = ASSETS_DIR) -> str:
+    """
+    Get the vendored copy of a SentenceTransformer model, or its name when it is not vendored
+
+    Args:
+        model_name (str): Name of the model
+        assets_dir (str): Directory of the vendored assets
+
+    Returns:
+        str: Local path or model name to load the model from
+    """
+    path = sentence_transformer_dir(model_name, assets_dir)
+    if os.path.isdir(path):
+        return path
+    if offline():
+        raise FileNotFoundError(f"{path} not found. Vendor it with 'python -m utils.bootstrap --model {model_name}'")
+    return model_name
+
+
+def use_language_tool_assets(assets_dir: str = ASSETS_DIR):
+    """
+    Make language_tool_python use the vendored LanguageTool server, when there is one
+    """
+    if os.path.isdir(language_tool_dir(assets_dir)):
+        os.environ.setdefault("LTP_PATH", os.path.abspath(language_tool_dir(assets_dir)))
+
+
+def ensure_nltk_data(assets_dir: str = ASSETS_DIR):
+    """
+    Make the NLTK tokenizer and tagger data available, preferring the vendored copy.
+    Missing packages are downloaded once, unless ASSETS_OFFLINE is set.
+    """
+    import nltk
+
+    path = os.path.abspath(nltk_dir(assets_dir))
+    if os.path.isdir(path) and path not in nltk.data.path:
+        nltk.data.path.insert(0, path)
+    for package in required_nltk_packages(nltk.__version__):
+        try:
+            nltk.data.find(NLTK_PACKAGES[package])
+        except LookupError:
+            if offline():
+                raise LookupError(f"NLTK package '{package}' not found. Vendor it with 'python -m utils.bootstrap'")
+            nltk.download(package, quiet=True)
+
+
+def bootstrap(assets_dir: str = ASSETS_DIR, model_names: list[str] = None):
+    """
+    Download the NLTK data, the LanguageTool server and the SentenceTransformer models into `assets_dir`
+
+    Args:
+        assets_dir (str): Directory the assets are written to
+        model_names (list): SentenceTransformer models to vendor. Defaults to the ranker's model.
+    """
+    import nltk
+
+    os.makedirs(nltk_dir(assets_dir), exist_ok=True)
+    for package in NLTK_PACKAGES:
+        # Newer NLTK releases renamed some packages; a name the index does not know is skipped
+        downloaded = nltk.download(package, download_dir=nltk_dir(assets_dir), quiet=True)
+        print(f"nltk {package}: {'ok' if downloaded else 'not available'}")
+
+    os.makedirs(language_tool_dir(assets_dir), exist_ok=True)
+    os.environ["LTP_PATH"] = os.path.abspath(language_tool_dir(assets_dir))
+    import language_tool_python
+
+    tool = language_tool_python.LanguageTool("en-US")
+    tool.close()
+    print(f"language tool: {language_tool_dir(assets_dir)}")
+
+    from sentence_transformers import SentenceTransformer
+
+    for model_name in model_names or ["bert-base-nli-mean-tokens"]:
+        SentenceTransformer(model_name).save(sentence_transformer_dir(model_name, assets_dir))
+        print(f"sentence transformer {model_name}: {sentence_transformer_dir(model_name, assets_dir)}")
+
+    from models import JobClassifier
+
+    # Converts the pickled model to the memory-mapped .joblib file, before the image is made read-only
+    print(f"job classifier: {JobClassifier().model_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vendor the runtime assets for offline use")
+    parser.add_argument("--assets-dir", default=ASSETS_DIR)
+    parser.add_argument("--model", action="append", dest="models", help="SentenceTransformer model, repeatable")
+    args = parser.parse_args()
+    bootstrap(args.assets_dir, args.models)
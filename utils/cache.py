@@ -0,0 +1,225 @@
+"""This file is for caching extraction and analysis results by document content"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for extraction and analysis results, keyed by a hash of the document.
+
+    Entries are looked up in an in-memory LRU first and then in a local SQLite file.
+    Entries are keyed by the version of the model that produced them as well, so results
+    of an older model are misses, and two models of the same kind (e.g. the two NER
+    backends) keep their results side by side. The SQLite tier evicts the least recently
+    used entries, stale versions included, once it grows past `max_bytes`.
+
+    The SQLite file is shared by processes in WAL mode. Reads do not write: the access
+    times used for eviction are collected in memory and written in batches.
+
+    Args:
+        path (str): Path of the SQLite file. Defaults to './.cache/analysis.sqlite3'.
+        memory_items (int): Number of entries kept in memory. Defaults to 1024.
+        max_bytes (int): Maximum size of the values stored on disk. Defaults to 512 MB.
+        touch_batch (int): Number of disk hits whose access time is written at once. Defaults to 256.
+        touch_interval (float): Seconds after which pending access times are written anyway. Defaults to 30.
+    """
+
+    def __init__(
+        self,
+        path: str = "./.cache/analysis.sqlite3",
+        memory_items: int = 1024,
+        max_bytes: int = 512 * 1024 * 1024,
+        touch_batch: int = 256,
+        touch_interval: float = 30.0,
+    ):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._touched = {}
+        self._touched_since = time.monotonic()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connect()
+        columns = self._db.execute("PRAGMA table_info(entries)").fetchall()
+        if columns and not any(name == "version" and pk for _, name, _, _, _, pk in columns):
+            # Files written before the version was part of the key are rebuilt
+            self._db.execute("DROP TABLE entries")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                version TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (kind, key, version)
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._db.commit()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # A SQLite connection must not be used across fork: a cache created before a
+        # server forks its workers opens its own connection in each of them
+        if self._pid != os.getpid():
+            self._connect()
+        return self._connection
+
+    @staticmethod
+    def digest(content) -> str:
+        """
+        Get the content address of a document
+
+        Args:
+            content (bytes | str): Raw PDF bytes or extracted text
+
+        Returns:
+            str: SHA-256 hex digest of the content
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return hashlib.sha256(content).hexdigest()
+
+    def _remember(self, entry: tuple, value):
+        self._memory[entry] = value
+        self._memory.move_to_end(entry)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, kind: str, key: str, version: str):
+        """
+        Look up a cached value
+
+        Args:
+            kind (str): Kind of result - e.g. 'extract', 'ner', 'job_role', 'embedding'
+            key (str): Content digest of the document
+            version (str): Version of the model the value must have been produced with
+
+        Returns:
+            object: The cached value, or None on a miss
+        """
+        entry = (kind, key, version)
+        with self._lock:
+            if entry in self._memory:
+                self._memory.move_to_end(entry)
+                self.hits += 1
+                return self._memory[entry]
+
+            row = self._db.execute(
+                "SELECT value FROM entries WHERE kind = ? AND key = ? AND version = ?", entry
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._touch(entry)
+            value = pickle.loads(row[0])
+            self._remember(entry, value)
+            self.hits += 1
+            return value
+
+    def set(self, kind: str, key: str, version: str, value):
+        """
+        Store a value in both tiers
+
+        Args:
+            kind (str): Kind of result - e.g. 'extract', 'ner', 'job_role', 'embedding'
+            key (str): Content digest of the document
+            version (str): Version of the model that produced the value
+            value (object): Picklable value to store
+        """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember((kind, key, version), value)
+            self._touched.pop((kind, key, version), None)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, version, blob, len(blob), time.time()),
+            )
+            self._write_touched()
+            self._evict()
+            self._db.commit()
+
+    def _touch(self, entry: tuple):
+        """
+        Record a disk hit, writing the pending access times once enough of them or enough time has piled up
+        """
+        self._touched[entry] = time.time()
+        if len(self._touched) >= self.touch_batch or time.monotonic() - self._touched_since >= self.touch_interval:
+            self._write_touched()
+            self._db.commit()
+
+    def _write_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE entries SET accessed = ? WHERE kind = ? AND key = ? AND version = ?",
+                [(accessed, *entry) for entry, accessed in self._touched.items()],
+            )
+            self._touched = {}
+        self._touched_since = time.monotonic()
+
+    def get_or_compute(self, kind: str, key: str, version: str, compute):
+        """
+        Look up a cached value, computing and storing it on a miss
+
+        Args:
+            kind (str): Kind of result
+            key (str): Content digest of the document
+            version (str): Version of the model producing the value
+            compute (callable): Function called without arguments to produce the value
+
+        Returns:
+            object: The cached or freshly computed value
+        """
+        value = self.get(kind, key, version)
+        if value is None:
+            value = compute()
+            self.set(kind, key, version, value)
+        return value
+
+    def _evict(self):
+        """
+        Delete the least recently used disk entries until the disk tier fits in `max_bytes`
+        """
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT kind, key, version, size FROM entries ORDER BY accessed")
+        evicted = []
+        for kind, key, version, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((kind, key, version))
+            total -= size
+        self._db.executemany("DELETE FROM entries WHERE kind = ? AND key = ? AND version = ?", evicted)
+
+    def close(self):
+        """
+        Write the pending access times and close the SQLite connection
+        """
+        with self._lock:
+            self._write_touched()
+            self._db.commit()
+            self._db.close()
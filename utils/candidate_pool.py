@@ -0,0 +1,417 @@
+"""This file is for storing resume embeddings of a candidate pool on disk"""
+
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class CandidatePool:
+    """
+    Class to persist resume embeddings so that a pool can be ranked against new job descriptions
+    without re-encoding the resumes.
+
+    The embeddings are kept L2-normalised in a memory-mapped array ('embeddings.npy'),
+    so a cosine similarity against the whole pool is a single matrix-vector product.
+    Candidate ids, their row in the array and optional metadata live in a SQLite id
+    table ('ids.sqlite3'), so adding or removing candidates only writes the changed rows.
+
+    Several processes can share a pool: writers hold an exclusive lock on 'pool.lock'
+    while they change it, readers a shared one, and every process picks up the changes
+    of the others before its next read.
+
+    The array can be stored in reduced precision: 'float16' halves its size, and
+    'int8' quarters it by storing every row scaled to [-127, 127] with its scale in
+    'scales.npy'. Both change the scores by well under a percentage point.
+
+    Args:
+        directory (str): Directory holding the pool files. Created if missing.
+        dtype (str): Storage precision of a new pool - 'float32'(default), 'float16', 'int8'.
+            An existing pool keeps the precision it was created with.
+    """
+
+    dtypes = ("float32", "float16", "int8")
+
+    def __init__(self, directory: str, dtype: str = "float32"):
+        if dtype not in self.dtypes:
+            raise ValueError(f"Unsupported dtype '{dtype}', expected one of {list(self.dtypes)}")
+        self.directory = directory
+        self._ids = []
+        self.dim = None
+        self.dtype = np.dtype(dtype)
+        self._rows = {}
+        self._matrix = None
+        self._matrix_inode = None
+        self._scales = None
+        self._data_version = None
+        self._generation = 0
+        self._lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._table_path = os.path.join(directory, "ids.sqlite3")
+        self._lock_path = os.path.join(directory, "pool.lock")
+        self._matrix_path = os.path.join(directory, "embeddings.npy")
+        self._scales_path = os.path.join(directory, "scales.npy")
+        self._connect()
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS candidates (id TEXT PRIMARY KEY, row INTEGER NOT NULL, metadata TEXT)"
+        )
+        with self._locked():
+            self._db.execute("INSERT OR IGNORE INTO settings VALUES ('dtype', ?)", (self.dtype.name,))
+            self._import_json_table()
+            self._data_version = None
+        self._refresh()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._connection = sqlite3.connect(self._table_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # A SQLite connection must not be used across fork
+        if self._pid != os.getpid():
+            self._connect()
+            self._data_version = None
+        return self._connection
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, candidate_id: str) -> bool:
+        self._refresh()
+        return candidate_id in self._rows
+
+    @property
+    def ids(self) -> list[str]:
+        """
+        Candidate ids in row order, including the ones other processes added
+        """
+        self._refresh()
+        return self._ids
+
+    @property
+    def generation(self) -> int:
+        """
+        Counter that changes whenever the pool changes, in this process or another one
+        """
+        self._refresh()
+        return self._generation
+
+    @contextmanager
+    def _locked(self, operation: int = fcntl.LOCK_EX):
+        """
+        Hold the pool lock of this process and the file lock shared with other processes,
+        with the id table up to date
+
+        Args:
+            operation (int): fcntl.LOCK_EX to change the pool, fcntl.LOCK_SH to read it
+        """
+        # The lock file is opened on every use: a descriptor inherited through fork would share its lock
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """
+        Reload the id table and re-map the arrays when another process changed the pool
+        """
+        with self._lock:
+            version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            settings = dict(self._db.execute("SELECT name, value FROM settings"))
+            self.dtype = np.dtype(settings.get("dtype", self.dtype.name))
+            self.dim = int(settings["dim"]) if "dim" in settings else None
+            self._ids = [candidate_id for candidate_id, in self._db.execute("SELECT id FROM candidates ORDER BY row")]
+            self._rows = {candidate_id: row for row, candidate_id in enumerate(self._ids)}
+            if os.path.exists(self._matrix_path) and os.stat(self._matrix_path).st_ino != self._matrix_inode:
+                # The array file was replaced by a larger one
+                self._matrix = np.load(self._matrix_path, mmap_mode="r+")
+                self._matrix_inode = os.stat(self._matrix_path).st_ino
+                if self.quantized:
+                    self._scales = np.load(self._scales_path, mmap_mode="r+")
+            self._data_version = version
+            self._generation += 1
+
+    def _import_json_table(self):
+        """
+        Move the id table of a pool written by an older version ('ids.json') into SQLite
+        """
+        json_path = os.path.join(self.directory, "ids.json")
+        if not os.path.exists(json_path):
+            return
+        with open(json_path, "r", encoding="utf-8") as f:
+            table = json.load(f)
+        self._db.execute("BEGIN")
+        self._db.execute("INSERT OR REPLACE INTO settings VALUES ('dtype', ?)", (table["dtype"],))
+        if table["dim"] is not None:
+            self._db.execute("INSERT OR REPLACE INTO settings VALUES ('dim', ?)", (str(table["dim"]),))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO candidates VALUES (?, ?, ?)",
+            [
+                (candidate_id, row, json.dumps(table["metadata"].get(candidate_id)))
+                for row, candidate_id in enumerate(table["ids"])
+            ],
+        )
+        self._db.execute("COMMIT")
+        os.remove(json_path)
+
+    @property
+    def quantized(self) -> bool:
+        return self.dtype == np.int8
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """
+        Normalised float32 embeddings of the pool, one row per id in `ids`
+        """
+        with self._locked(fcntl.LOCK_SH):
+            if self._matrix is None:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            return np.array(self._decode(0, len(self._ids)))
+
+    def snapshot(self, ids: list[str] = None) -> tuple[list[str], np.ndarray]:
+        """
+        Read candidate ids together with their embeddings, consistent with each other
+
+        Args:
+            ids (list): Candidate ids to read. Unknown ids are skipped. All candidates when not given.
+
+        Returns:
+            tuple: Candidate ids and their normalised float32 embeddings, one row per id
+        """
+        with self._locked(fcntl.LOCK_SH):
+            if ids is None:
+                ids = list(self._ids)
+            ids = [candidate_id for candidate_id in ids if candidate_id in self._rows]
+            if self._matrix is None or not ids:
+                return ids, np.empty((0, self.dim or 0), dtype=np.float32)
+            rows = np.array([self._rows[candidate_id] for candidate_id in ids])
+            embeddings = self._matrix[rows].astype(np.float32)
+            if self.quantized:
+                embeddings *= self._scales[rows, None]
+            return ids, embeddings
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size in bytes of the stored embeddings
+        """
+        size = len(self._ids) * (self.dim or 0) * self.dtype.itemsize
+        if self.quantized:
+            size += len(self._ids) * np.dtype(np.float32).itemsize
+        return size
+
+    def _encode(self, embeddings: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Convert normalised float32 embeddings to the storage precision
+
+        Returns:
+            tuple: Stored rows and, for 'int8', the scale of every row
+        """
+        if not self.quantized:
+            return embeddings.astype(self.dtype), None
+        scales = np.maximum(np.abs(embeddings).max(axis=1), 1e-12) / 127
+        return np.round(embeddings / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _decode(self, start: int, end: int) -> np.ndarray:
+        """
+        Read stored rows back as float32 embeddings
+        """
+        rows = self._matrix[start:end]
+        if self.dtype == np.float32:
+            return rows
+        rows = rows.astype(np.float32)
+        if self.quantized:
+            rows *= self._scales[start:end, None]
+        return rows
+
+    def _reserve(self, rows: int):
+        """
+        Make room for at least `rows` embeddings, doubling the capacity of the array file
+        """
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 64)
+        self._matrix = self._grow(self._matrix, self._matrix_path, self.dtype, (new_capacity, self.dim))
+        self._matrix_inode = os.stat(self._matrix_path).st_ino
+        if self.quantized:
+            self._scales = self._grow(self._scales, self._scales_path, np.float32, (new_capacity,))
+
+    def _grow(self, array: np.ndarray, path: str, dtype, shape: tuple) -> np.ndarray:
+        """
+        Copy the filled rows of a memory-mapped array into a larger array file
+        """
+        grown = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=dtype, shape=shape)
+        if array is not None:
+            grown[: len(self._ids)] = array[: len(self._ids)]
+            del array
+        grown.flush()
+        del grown
+        os.replace(path + ".tmp", path)
+        return np.load(path, mmap_mode="r+")
+
+    def _normalise(self, embeddings) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def add(self, ids: list[str], embeddings, metadata: list[dict] = None):
+        """
+        Add candidates to the pool, replacing the embeddings of ids that are already stored.
+        When an id is given more than once, its last embedding is kept.
+
+        Args:
+            ids (list): Candidate ids, e.g. content digests of the resumes
+            embeddings (array-like): Resume embeddings, one row per id
+            metadata (list): Optional JSON-serialisable metadata per candidate
+        """
+        embeddings = self._normalise(embeddings)
+        metadata = metadata or [None] * len(ids)
+        positions = {candidate_id: position for position, candidate_id in enumerate(ids)}
+        with self._locked():
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                self._db.execute("INSERT OR REPLACE INTO settings VALUES ('dim', ?)", (str(self.dim),))
+            new_ids = [candidate_id for candidate_id in positions if candidate_id not in self._rows]
+            self._reserve(len(self._ids) + len(new_ids))
+            stored, scales = self._encode(embeddings)
+            rows = {candidate_id: self._rows.get(candidate_id) for candidate_id in positions}
+            for number, candidate_id in enumerate(new_ids):
+                rows[candidate_id] = len(self._ids) + number
+            for candidate_id, position in positions.items():
+                self._matrix[rows[candidate_id]] = stored[position]
+                if scales is not None:
+                    self._scales[rows[candidate_id]] = scales[position]
+            self.save()
+
+            # Rows are only published once their embeddings are on disk
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO candidates VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+                "metadata = COALESCE(excluded.metadata, metadata)",
+                [
+                    (candidate_id, rows[candidate_id], None if metadata[position] is None else json.dumps(metadata[position]))
+                    for candidate_id, position in positions.items()
+                ],
+            )
+            self._db.execute("COMMIT")
+            for candidate_id in new_ids:
+                self._rows[candidate_id] = len(self._ids)
+                self._ids.append(candidate_id)
+            # The commits of this connection do not change its own data_version
+            self._generation += 1
+
+    def remove(self, ids: list[str]):
+        """
+        Remove candidates from the pool. The last rows are moved into the freed slots.
+
+        Args:
+            ids (list): Candidate ids to remove
+        """
+        with self._locked():
+            removed = []
+            moved = {}
+            for candidate_id in ids:
+                row = self._rows.pop(candidate_id, None)
+                if row is None:
+                    continue
+                removed.append(candidate_id)
+                moved.pop(candidate_id, None)
+                last_id = self._ids.pop()
+                if last_id != candidate_id:
+                    self._matrix[row] = self._matrix[len(self._ids)]
+                    if self.quantized:
+                        self._scales[row] = self._scales[len(self._ids)]
+                    self._ids[row] = last_id
+                    self._rows[last_id] = row
+                    moved[last_id] = row
+            if not removed:
+                return
+            self.save()
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM candidates WHERE id = ?", [(candidate_id,) for candidate_id in removed])
+            self._db.executemany(
+                "UPDATE candidates SET row = ? WHERE id = ?", [(row, candidate_id) for candidate_id, row in moved.items()]
+            )
+            self._db.execute("COMMIT")
+            self._generation += 1
+
+    def save(self):
+        """
+        Flush the embeddings to disk
+        """
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+            if self._scales is not None:
+                self._scales.flush()
+
+    def get_metadata(self, ids: list[str]) -> list[dict]:
+        """
+        Get the stored metadata of candidates
+
+        Args:
+            ids (list): Candidate ids
+
+        Returns:
+            list: Metadata per id, or None for ids without metadata
+        """
+        found = {}
+        with self._lock:
+            # Looked up in chunks that stay below SQLite's limit on query parameters
+            for start in range(0, len(ids), 500):
+                chunk = list(ids[start : start + 500])
+                found.update(
+                    self._db.execute(
+                        f"SELECT id, metadata FROM candidates WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                    )
+                )
+        return [json.loads(found[candidate_id]) if found.get(candidate_id) else None for candidate_id in ids]
+
+    def _score(self, query: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+        """
+        Score a normalised query against every stored embedding. Reduced-precision rows are
+        converted in blocks, so memory use stays bounded for large pools.
+        """
+        if self._matrix is None:
+            return np.empty(0, dtype=np.float32)
+        if self.dtype == np.float32:
+            return self._matrix[: len(self._ids)] @ query
+        return np.concatenate(
+            [self._decode(start, min(start + block_rows, len(self._ids))) @ query for start in range(0, len(self._ids), block_rows)]
+            or [np.empty(0, dtype=np.float32)]
+        )
+
+    def search(self, query, top_k: int = None) -> list[tuple[str, float]]:
+        """
+        Score a query embedding against every stored embedding
+
+        Args:
+            query (array-like): Embedding of the job description
+            top_k (int): Number of best candidates to return. All candidates when not given.
+
+        Returns:
+            list: Tuples of candidate id and cosine similarity, best first
+        """
+        query = self._normalise([query])[0]
+        with self._locked(fcntl.LOCK_SH):
+            scores = self._score(query)
+            ids = list(self._ids)
+        if top_k is not None and top_k < len(scores):
+            best = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(ids[row], float(scores[row])) for row in best]
@@ -0,0 +1,123 @@
+"""This file is for removing known entities from resume text"""
+
+from collections import deque
+
+
+def _fold(text: str) -> str:
+    """
+    Lower-case a text character by character, keeping its length (and so its offsets) unchanged
+    """
+    return "".join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class EntityMasker:
+    """
+    Class to find and remove entity mentions from a text in one linear pass.
+
+    The entities are compiled into an Aho-Corasick automaton, so the cost of a pass
+    depends on the length of the text and the number of matches, not on the number
+    of entities. Matching is case-insensitive, an entity must start and end on a word
+    boundary (as with `\\b` in a regex), and overlapping mentions resolve to the
+    leftmost, longest one.
+
+    Args:
+        entities (list): Entity strings to look for. Empty strings are ignored.
+    """
+
+    def __init__(self, entities: list[str]):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for entity in set(_fold(entity) for entity in entities if entity):
+            self._insert(entity)
+        self._build_failure_links()
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def _insert(self, entity: str):
+        node = 0
+        for char in entity:
+            if char not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][char] = len(self._goto) - 1
+            node = self._goto[node][char]
+        self._output[node].append(len(entity))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _on_boundary(self, text: str, start: int, end: int) -> bool:
+        if _is_word(text[start]) and start > 0 and _is_word(text[start - 1]):
+            return False
+        if _is_word(text[end - 1]) and end < len(text) and _is_word(text[end]):
+            return False
+        return True
+
+    def find(self, text: str) -> list[tuple[int, int]]:
+        """
+        Find the entity mentions in a text
+
+        Args:
+            text (str): Text to search
+
+        Returns:
+            list: Non-overlapping (start, end) offsets of the mentions, in text order
+        """
+        if not self:
+            return []
+        longest = {}
+        node = 0
+        for position, char in enumerate(_fold(text)):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length in self._output[node]:
+                start = position + 1 - length
+                if length > longest.get(start, 0) and self._on_boundary(text, start, position + 1):
+                    longest[start] = length
+
+        spans = []
+        covered = 0
+        for start in sorted(longest):
+            if start >= covered:
+                spans.append((start, start + longest[start]))
+                covered = start + longest[start]
+        return spans
+
+    def mask(self, text: str, replacement: str = "") -> str:
+        """
+        Replace every entity mention in a text
+
+        Args:
+            text (str): Text to mask
+            replacement (str): Text inserted in place of each mention. Defaults to removing it.
+
+        Returns:
+            str: The masked text
+        """
+        pieces = []
+        previous = 0
+        for start, end in self.find(text):
+            pieces.append(text[previous:start])
+            pieces.append(replacement)
+            previous = end
+        pieces.append(text[previous:])
+        return "".join(pieces)
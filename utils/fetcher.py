@@ -0,0 +1,147 @@
+"""This file is for downloading PDF files from URLs"""
+
+import asyncio
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import metrics
+
+
+class PDFFetcher:
+    """
+    Class to download files concurrently over pooled HTTP connections.
+
+    Args:
+        max_connections (int): Maximum number of open connections. Defaults to 20.
+        per_host (int): Maximum number of concurrent downloads per host. Every Drive link
+            resolves to the same host, so this bounds a whole batch. Defaults to `max_connections`.
+        retries (int): Number of retries for failed or throttled downloads. Defaults to 3.
+        backoff (float): Base delay in seconds between retries, doubled on every attempt. Defaults to 0.5.
+        max_bytes (int): Maximum size of a downloaded file in bytes. Defaults to 10 MB.
+        timeout (float): Timeout in seconds for connecting and for each read. Defaults to 10.
+        transport (httpx.AsyncBaseTransport): Transport used instead of the network, e.g. httpx.MockTransport.
+    """
+
+    retry_status_codes = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        per_host: int = None,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_bytes: int = 10 * 1024 * 1024,
+        timeout: float = 10.0,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.max_connections = max_connections
+        self.per_host = per_host or max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.transport = transport
+
+    def _client(self) -> httpx.AsyncClient:
+        """
+        Create a client with a connection pool shared by all downloads of a batch
+        """
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+            timeout=self.timeout,
+            follow_redirects=True,
+            transport=self.transport,
+        )
+
+    def _retry_delay(self, attempt: int, response: httpx.Response = None) -> float:
+        """
+        Get the delay before the next attempt, honouring a numeric Retry-After header
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * 2**attempt
+
+    async def _read_body(self, response: httpx.Response) -> bytes:
+        """
+        Stream the response body into memory, enforcing the size limit
+
+        Raises:
+            ValueError: If the body is larger than `max_bytes`
+        """
+        length = response.headers.get("Content-Length", "")
+        if length.isdigit() and int(length) > self.max_bytes:
+            raise ValueError(f"File is larger than {self.max_bytes} bytes")
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body.extend(chunk)
+            if len(body) > self.max_bytes:
+                raise ValueError(f"File is larger than {self.max_bytes} bytes")
+        return bytes(body)
+
+    async def fetch(self, client: httpx.AsyncClient, url: str) -> bytes:
+        """
+        Download a single URL, retrying transport errors and throttled or failed responses
+
+        Args:
+            client (httpx.AsyncClient): Client to download with
+            url (str): URL to download
+
+        Returns:
+            bytes: Content of the downloaded file
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                async with client.stream("GET", url) as response:
+                    if response.status_code in self.retry_status_codes and attempt < self.retries:
+                        delay = self._retry_delay(attempt, response)
+                    else:
+                        response.raise_for_status()
+                        return await self._read_body(response)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                delay = self._retry_delay(attempt)
+            await asyncio.sleep(delay)
+
+    @metrics.timed("pdf.download")
+    async def fetch_all(self, urls: list[str], on_result=None) -> list:
+        """
+        Download several URLs concurrently
+
+        Args:
+            urls (list): URLs to download
+            on_result (callable): Called with the position in `urls` and the result of every
+                download as soon as it finishes, in completion order
+
+        Returns:
+            list: File contents in the same order as `urls`, or the exception raised for a failed download
+        """
+        host_limits = {}
+
+        async def limited_fetch(client, index, url):
+            host = urlsplit(url).netloc
+            if host not in host_limits:
+                host_limits[host] = asyncio.Semaphore(self.per_host)
+            async with host_limits[host]:
+                try:
+                    result = await self.fetch(client, url)
+                except Exception as e:
+                    result = e
+            if on_result is not None:
+                on_result(index, result)
+            return result
+
+        async with self._client() as client:
+            return await asyncio.gather(*(limited_fetch(client, index, url) for index, url in enumerate(urls)))
+
+    def fetch_all_sync(self, urls: list[str], on_result=None) -> list:
+        """
+        Blocking version of `fetch_all` for callers without a running event loop
+        """
+        return asyncio.run(self.fetch_all(urls, on_result))
@@ -1,6 +1,394 @@
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import metrics
+
+
+class RequestBudget:
+    """
+    Class for a token bucket of API requests: it holds up to `capacity` requests and
+    refills continuously, reaching full capacity again `refill_seconds` after it was emptied.
+    """
+
+    def __init__(self, capacity: int, refill_seconds: float):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self._available = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.refill_seconds > 0:
+            self._available = min(
+                self.capacity, self._available + (now - self._updated) * self.capacity / self.refill_seconds
+            )
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._available
+
+    def spend(self, cost: int) -> bool:
+        """
+        Take `cost` requests from the budget
+
+        Returns:
+            bool: False, without taking anything, if fewer than `cost` requests are left
+        """
+        with self._lock:
+            self._refill()
+            if self._available < cost:
+                return False
+            self._available -= cost
+            return True
+
+
+class GitHubClient:
+    """
+    Class for a pooled, caching client of the GitHub REST API
+
+    Every GET is sent as a conditional request when an ETag is known, so unchanged
+    resources come back as a `304 Not Modified` that does not count against the rate
+    limit. The rate-limit headers of every response are tracked, and no request is
+    sent while the limit is exhausted. Computed statistics are cached per username.
+    Both caches keep their most recently used entries only.
+
+    Every user lookup that is not served from the cache is charged against a request
+    budget that refills over time, shared by everything using the client.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "https://api.github.com",
+        token: str = None,
+        session: requests.Session = None,
+        ttl: float = 3600,
+        max_event_pages: int = 3,
+        pool_size: int = 16,
+        timeout: float = 10,
+        max_etags: int = 4096,
+        max_users: int = 1024,
+        request_budget: int = 100,
+        budget_refill_seconds: float = 3600,
+    ):
+        """
+        Initialize the client
+
+        Args:
+            base_url (str): Root of the GitHub API, e.g. a local mock for tests
+            token (str): GitHub access token. Defaults to the GITHUB_TOKEN environment variable
+            session (requests.Session): Session to send requests with. A pooled one is created when not given
+            ttl (float): Seconds for which the statistics of a user are cached
+            max_event_pages (int): Maximum number of event pages fetched per user
+            pool_size (int): Number of pooled connections
+            timeout (float): Timeout in seconds of every request
+            max_etags (int): Number of responses kept for conditional requests
+            max_users (int): Number of users whose statistics are cached
+            request_budget (int): Maximum number of API requests lookups may spend at once
+            budget_refill_seconds (float): Seconds for an exhausted request budget to refill completely
+        """
+        self.base_url = base_url.rstrip("/")
+        self.token = token or os.getenv("GITHUB_TOKEN")
+        self.ttl = ttl
+        self.max_event_pages = max_event_pages
+        self.timeout = timeout
+        self.max_etags = max_etags
+        self.max_users = max_users
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = 0.0
+        self.budget = RequestBudget(request_budget, budget_refill_seconds)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if self.token:
+            self.session.headers["Authorization"] = f"token {self.token}"
+
+        self._etags = OrderedDict()
+        self._statistics = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    def _get_cached(self, cache: OrderedDict, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _set_cached(self, cache: OrderedDict, key, value, max_items: int):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > max_items:
+                cache.popitem(last=False)
+
+    def rate_limited(self) -> bool:
+        """
+        Check whether the rate limit is exhausted until its reset time
+        """
+        return self.rate_limit_remaining == 0 and time.time() < self.rate_limit_reset
+
+    def _track_rate_limit(self, response: requests.Response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        with self._lock:
+            if remaining is not None:
+                self.rate_limit_remaining = int(remaining)
+            if reset is not None:
+                self.rate_limit_reset = float(reset)
+
+    def get_json(self, path: str, params: dict = None) -> tuple[int, object]:
+        """
+        Send a conditional GET request to the API
+
+        Args:
+            path (str): API path, e.g. '/users/octocat'
+            params (dict): Query parameters
+
+        Returns:
+            tuple: Status code and decoded JSON body. A 304 returns the cached body with status 200.
+        """
+        url = f"{self.base_url}{path}"
+        cache_key = (url, tuple(sorted((params or {}).items())))
+        cached = self._get_cached(self._etags, cache_key)
+        if self.rate_limited():
+            if cached:
+                return 200, cached[1]
+            return 403, {"message": "API rate limit exceeded"}
+
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        self._track_rate_limit(response)
+        if response.status_code == 304 and cached:
+            return 200, cached[1]
+        if response.status_code != 200:
+            return response.status_code, None
+
+        data = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self._set_cached(self._etags, cache_key, (etag, data), self.max_etags)
+        return 200, data
+
+    def user(self, username: str) -> tuple[int, dict]:
+        return self.get_json(f"/users/{username}")
+
+    def repos(self, username: str) -> tuple[int, list]:
+        return self.get_json(f"/users/{username}/repos", {"per_page": 100})
+
+    def events(self, username: str) -> tuple[int, list]:
+        """
+        Get the public events of a user, following pagination up to `max_event_pages`
+        """
+        events = []
+        for page in range(1, self.max_event_pages + 1):
+            status, data = self.get_json(f"/users/{username}/events", {"per_page": 100, "page": page})
+            if status != 200:
+                return (status, events) if events else (status, None)
+            events.extend(data)
+            if len(data) < 100:
+                break
+        return 200, events
+
+    def fetch(self, username: str) -> dict:
+        """
+        Fetch the user, repositories and events of a user concurrently
+
+        Returns:
+            dict: (status, data) tuples under 'user', 'repos' and 'events'
+        """
+        futures = {
+            "user": self._executor.submit(self.user, username),
+            "repos": self._executor.submit(self.repos, username),
+            "events": self._executor.submit(self.events, username),
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+    @property
+    def lookup_cost(self) -> int:
+        """
+        Most API requests one user lookup sends: the user, the repositories and every event page
+        """
+        return 2 + self.max_event_pages
+
+    def cached_statistics(self, username: str) -> dict:
+        """
+        Get the statistics of a user if they are cached and fresh, without any request
+        """
+        cached = self._get_cached(self._statistics, username)
+        if cached and cached[0] > time.time():
+            return cached[1]
+        return None
+
+    def statistics(self, username: str) -> dict:
+        """
+        Get the statistics of a user, cached for `ttl` seconds
+
+        Args:
+            username (str): GitHub username
+
+        Returns:
+            dict: GitHub statistics, or a dictionary with the failing status code under 'Error'.
+                The status is 429 when the request budget cannot pay for the lookup.
+        """
+        cached = self.cached_statistics(username)
+        if cached is not None:
+            return cached
+        if not self.budget.spend(self.lookup_cost):
+            return {"Error": 429}
+
+        statistics = _summarise(self.fetch(username))
+        if "Error" not in statistics:
+            self._set_cached(self._statistics, username, (time.time() + self.ttl, statistics), self.max_users)
+        return statistics
+
+
+def _summarise(responses: dict) -> dict:
+    """
+    Build the statistics of a user from the fetched user, repositories and events
+    """
+    user_status, user_data = responses["user"]
+    if user_status != 200:
+        return {"Error": user_status}
+    repos_status, repos = responses["repos"]
+    if repos_status != 200:
+        return {"Error": repos_status}
+
+    last_year_date = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    _, events = responses["events"]
+    recent_repo = max(repos, key=lambda x: x["created_at"]) if repos else None
+    return {
+        "name": user_data["name"],
+        "followers": user_data["followers"],
+        "following": user_data["following"],
+        "commits_since_joined": sum(repo["size"] for repo in repos),
+        "commits_current_year": sum(
+            1 for event in events or [] if event["type"] == "PushEvent" and event["created_at"] >= last_year_date
+        ),
+        "Language Usage": {lang: round((sum(1 for repo in repos if repo["language"] == lang) / len(repos)) * 100, 2) for lang in set(repo["language"] for repo in repos if repo["language"])},
+        "recent_repo": {
+            "repo_name": recent_repo["name"],
+            "date_created": recent_repo["created_at"],
+            "description": recent_repo["description"]
+        } if recent_repo else None,
+        "stars_earned": sum(repo["stargazers_count"] for repo in repos),
+        "total_public_repos_created": user_data["public_repos"]
+    }
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> GitHubClient:
+    """
+    Get the process-wide GitHub client shared by all `GitHubStatistics` and `GitHubEnricher`
+    instances. Its request budget is set with GITHUB_TOKEN_BUDGET and GITHUB_TOKEN_REFILL_SECONDS.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = GitHubClient(
+                request_budget=int(os.getenv("GITHUB_TOKEN_BUDGET", 100)),
+                budget_refill_seconds=float(os.getenv("GITHUB_TOKEN_REFILL_SECONDS", 3600)),
+            )
+        return _default_client
+
+
+class GitHubEnricher:
+    """
+    Class to add GitHub statistics to the top candidates of a ranking concurrently
+
+    Every lookup is charged against the request budget of the client, shared by the
+    whole process, and no lookups are started while the budget or the client's rate
+    limit is exhausted. Usernames shared by several candidates are looked up once.
+
+    Lookups run on threads shared by every call, so that the ones a time budget gave up
+    on finish in the background, into the client's cache, without piling up threads.
+    """
+
+    def __init__(self, client: GitHubClient = None, max_workers: int = 4):
+        """
+        Initialize the enricher
+
+        Args:
+            client (GitHubClient): Client to query GitHub with. Defaults to the shared client
+            max_workers (int): Number of users looked up concurrently
+        """
+        self.client = client or get_default_client()
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _submit(self, username: str) -> Future:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="github")
+            return self._executor.submit(self._lookup, username)
+
+    def _lookup(self, username: str) -> dict:
+        try:
+            return self.client.statistics(username)
+        except requests.RequestException as e:
+            return {"Error": str(e)}
+
+    @metrics.timed("github.enrich")
+    def enrich(self, ranking: dict, top_k: int = 5, time_budget: float = None) -> dict:
+        """
+        Add a 'github_stats' entry to the top-k candidates of a ranking that have a GitHub username.
+        Candidates whose lookup fails or does not finish within the time budget are left unchanged.
+
+        Args:
+            ranking (dict): Ranking as returned by `ResumeRanker.get_similarity`, best first
+            top_k (int): Number of best candidates to enrich. Defaults to 5.
+            time_budget (float): Seconds to wait for the lookups. No limit when not given.
+
+        Returns:
+            dict: The same ranking, enriched in place
+        """
+        candidates = [candidate for candidate in list(ranking.values())[:top_k] if candidate.get("github")]
+        usernames = list(dict.fromkeys(candidate["github"][0] for candidate in candidates))
+
+        # Lookups the budget cannot pay for are not scheduled; `statistics` charges the ones that are
+        affordable = self.client.budget.available
+        if self.client.rate_limit_remaining is not None:
+            affordable = min(affordable, self.client.rate_limit_remaining)
+        statistics = {}
+        scheduled = []
+        for username in usernames:
+            cached = self.client.cached_statistics(username)
+            if cached is not None:
+                statistics[username] = cached
+            elif affordable >= self.client.lookup_cost and not self.client.rate_limited():
+                affordable -= self.client.lookup_cost
+                scheduled.append(username)
+
+        futures = {username: self._submit(username) for username in scheduled}
+        if futures:
+            wait(futures.values(), timeout=time_budget)
+        for username, future in futures.items():
+            if future.done():
+                statistics[username] = future.result()
+
+        for candidate in candidates:
+            result = statistics.get(candidate["github"][0])
+            if result is not None and "Error" not in result:
+                candidate["github_stats"] = result
+        return ranking
 
 
 class GitHubStatistics:
@@ -8,16 +396,17 @@ class GitHubStatistics:
     Class to retrieve GitHub statistics for a user
     """
 
-    def __init__(self, username: str):
+    def __init__(self, username: str, client: GitHubClient = None):
         """
-        Initialize GitHubStatistics with the user's GitHub username and access token
+        Initialize GitHubStatistics with the user's GitHub username
 
         Args:
             username (str): GitHub username
-            access_token (str): GitHub access token
+            client (GitHubClient): Client to query GitHub with. Defaults to a shared client
+                authenticated with the GITHUB_TOKEN environment variable
         """
         self.username = username
-        self.access_token = os.getenv("GITHUB_TOKEN")
+        self.client = client or get_default_client()
 
     def _get_user_data(self) -> dict:
         """
@@ -26,34 +415,17 @@ class GitHubStatistics:
         Returns:
             dict: User data.
         """
-        user_url = f"https://api.github.com/users/{self.username}"
-        headers = {"Authorization": f"token {self.access_token}"}
-        response = requests.get(user_url, headers=headers)
-        response = requests.get(user_url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"Error": response.status_code}
+        status, data = self.client.user(self.username)
+        return data if status == 200 else {"Error": status}
 
     def _get_all_commits_last_year(self) -> int:
         """
         Retrieve the number of commits made by the user in the last year
 
         Returns:
-            int: Number of commits made in the last year
-        """
-        last_year_date = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%dT%H:%M:%SZ")
-        commits = 0
-        events_url = f"https://api.github.com/users/{self.username}/events"
-        response = requests.get(events_url)
-        if response.status_code == 200:
-            events = response.json()
-            for event in events:
-                if event["type"] == "PushEvent" and event["created_at"] >= last_year_date:
-                    commits += 1
-            return commits
-        else:
-            return {"Error": response.status_code}
+            int: Number of commits made in the last year, or None if the statistics could not be retrieved
+        """
+        return self.get_statistics().get("commits_current_year")
 
     def _get_all_prs(self) -> list:
         """
@@ -62,39 +434,20 @@ class GitHubStatistics:
         Returns:
             list: List of pull request events
         """
-        prs = []
-        page = 1
-        while True:
-            prs_url = f"https://api.github.com/users/{self.username}/events?page={page}"
-            headers = {"Authorization": f"token {self.access_token}"}
-            response = requests.get(prs_url, headers=headers)
-            response = requests.get(prs_url)
-            if response.status_code == 200:
-                events = response.json()
-                if not events:  # No more events, stop pagination
-                    break
-                for event in events:
-                    if event["type"] == "PullRequestEvent":
-                        prs.append(event)
-                page += 1
-            else:
-                return {"Error": response.status_code}
-                break
-        return prs
+        status, events = self.client.events(self.username)
+        if events is None:
+            return {"Error": status}
+        return [event for event in events if event["type"] == "PullRequestEvent"]
 
     def _get_total_public_repos(self) -> int:
         """
         Retrieve the total number of public repositories created by the user
 
         Returns:
-            int: Total number of public repositories
-        """
-        user_data = self._get_user_data()
-        if user_data:
-            return user_data["public_repos"]
-        else:
-            return None
-    
+            int: Total number of public repositories, or None if the statistics could not be retrieved
+        """
+        return self.get_statistics().get("total_public_repos_created")
+
     def get_contribution_graph(self):
         return f"https://github-readme-activity-graph.vercel.app/graph?username={self.username}&bg_color=000&point=fff&theme=github-compact"
 
@@ -105,32 +458,7 @@ class GitHubStatistics:
         Returns:
             dict: GitHub statistics
         """
-        user_data = self._get_user_data()
-        print("\n=======================\n",user_data, "\n=======================\n")
-        if user_data:
-            repos_url = user_data["repos_url"]
-            repos_response = requests.get(repos_url)
-            if repos_response.status_code == 200:
-                repos = repos_response.json()
-                return {
-                    "name": user_data["name"],
-                    "followers": user_data["followers"],
-                    "following": user_data["following"],
-                    "commits_since_joined": sum(repo["size"] for repo in repos),
-                    "commits_current_year": self._get_all_commits_last_year(),
-                    "Language Usage": {lang: round((sum(1 for repo in repos if repo["language"] == lang) / len(repos)) * 100, 2) for lang in set(repo["language"] for repo in repos if repo["language"])},
-                    "recent_repo": {
-                        "repo_name": max(repos, key=lambda x: x["created_at"])["name"],
-                        "date_created": max(repos, key=lambda x: x["created_at"])["created_at"],
-                        "description": max(repos, key=lambda x: x["created_at"])["description"]
-                    },
-                    "stars_earned": sum(repo["stargazers_count"] for repo in repos),
-                    "total_public_repos_created": self._get_total_public_repos()
-                }
-            else:
-                return {"Error": repos_response}
-        else:
-            return None
+        return self.client.statistics(self.username)
 
     def get_statistics(self) -> dict:
         """
@@ -145,9 +473,8 @@ class GitHubStatistics:
 # Example usage:
 if __name__ == "__main__":
     username = "nimisha-sara"
-    
+
     statistics = GitHubStatistics(username).get_statistics()
     if statistics:
         for key, value in statistics.items():
             print(f"{key}: {value}")
-
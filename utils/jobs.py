@@ -0,0 +1,404 @@
+"""This file is for running large ranking batches as background jobs"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .pdf import PDF, extraction_pool, shutdown_extraction_pool
+from .registry import ModelRegistry
+
+
+class JobQueue:
+    """
+    Class for a persistent queue of ranking jobs stored in a local SQLite file.
+
+    Uploaded PDFs are written next to the database, so queued jobs survive restarts
+    of both the web server and the workers. A job whose worker died, or stopped sending
+    heartbeats, while running it is queued again, up to `max_attempts` runs in total,
+    after which it fails.
+
+    Args:
+        path (str): Path of the SQLite file. Defaults to './.cache/jobs.sqlite3'.
+        max_attempts (int): Number of times a job is run before it is given up. Defaults to 3.
+        stale_after (float): Seconds without a heartbeat after which a running job is
+            considered abandoned, even if a process with its worker's pid exists. Defaults to 120.
+    """
+
+    def __init__(self, path: str = "./.cache/jobs.sqlite3", max_attempts: int = 3, stale_after: float = 120.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self.files_dir = os.path.join(os.path.dirname(path) or ".", "job_files")
+        os.makedirs(self.files_dir, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    job_description TEXT NOT NULL,
+                    path_type TEXT NOT NULL,
+                    documents TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    worker_pid INTEGER,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+                """
+            )
+            columns = [row["name"] for row in db.execute("PRAGMA table_info(jobs)")]
+            if "attempts" not in columns:
+                # Queues created before attempts were counted
+                db.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def submit(self, job_description: str, documents: list, path_type: str) -> str:
+        """
+        Add a ranking job to the queue
+
+        Args:
+            job_description (str): Job description text
+            documents (list): (filename, content) tuples for 'stream', or links for 'url'
+            path_type (str): Type of the documents - 'stream', 'url'
+
+        Returns:
+            str: Id of the queued job
+        """
+        job_id = uuid.uuid4().hex
+        if path_type == "stream":
+            job_dir = os.path.join(self.files_dir, job_id)
+            os.makedirs(job_dir)
+            stored = []
+            for number, (filename, content) in enumerate(documents):
+                file_path = os.path.join(job_dir, f"{number}.pdf")
+                with open(file_path, "wb") as f:
+                    f.write(content)
+                stored.append([filename, file_path])
+            documents = stored
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, job_description, path_type, documents, total, created, updated) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, job_description, path_type, json.dumps(documents), len(documents), now, now),
+            )
+        return job_id
+
+    def status(self, job_id: str) -> dict:
+        """
+        Get the status and progress of a job
+
+        Args:
+            job_id (str): Id of the job
+
+        Returns:
+            dict: Status, progress and error of the job, or None if the job does not exist
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT id, status, total, done, error, attempts, created, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def result(self, job_id: str) -> dict:
+        """
+        Get the result of a finished job
+
+        Args:
+            job_id (str): Id of the job
+
+        Returns:
+            dict: Dictionary with the 'ranking' and the 'error' files, or None if the job has not finished
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT result FROM jobs WHERE id = ? AND status = 'done'", (job_id,)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row["result"])
+        result["ranking"] = {candidate.pop("index"): candidate for candidate in result["ranking"]}
+        return result
+
+    def claim(self) -> dict:
+        """
+        Atomically take the oldest queued job and mark it as running in this process
+
+        Returns:
+            dict: The claimed job, or None if the queue is empty
+        """
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', worker_pid = ?, done = 0, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?",
+                (os.getpid(), time.time(), row["id"]),
+            )
+            db.execute("COMMIT")
+        job = dict(row, status="running", worker_pid=os.getpid(), attempts=row["attempts"] + 1)
+        job["documents"] = json.loads(job["documents"])
+        return job
+
+    def progress(self, job_id: str, done: int):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET done = ?, updated = ? WHERE id = ?", (done, time.time(), job_id))
+
+    def heartbeat(self, job_id: str):
+        """
+        Record that the worker of a running job is still alive
+        """
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+
+    def complete(self, job_id: str, ranking: dict, error_files: list):
+        """
+        Store the result of a job and remove its uploaded files
+
+        Args:
+            job_id (str): Id of the job
+            ranking (dict): Ranking as returned by `ResumeRanker.get_similarity`
+            error_files (list): [filename, error] pairs of the files that could not be read
+        """
+        result = {
+            "ranking": [{"index": key, **candidate} for key, candidate in ranking.items()],
+            "error": error_files,
+        }
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', done = total, result = ?, updated = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+        shutil.rmtree(os.path.join(self.files_dir, job_id), ignore_errors=True)
+
+    def fail(self, job_id: str, error: str):
+        """
+        Mark a job as failed and remove its uploaded files
+
+        Args:
+            job_id (str): Id of the job
+            error (str): Reason of the failure
+        """
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+        shutil.rmtree(os.path.join(self.files_dir, job_id), ignore_errors=True)
+
+    def requeue_stale(self):
+        """
+        Put running jobs whose worker process no longer exists, or has not sent a heartbeat
+        for `stale_after` seconds, back in the queue, or fail them once they have been run
+        `max_attempts` times
+        """
+        stale = time.time() - self.stale_after
+        with self._connect() as db:
+            rows = db.execute("SELECT id, worker_pid, attempts, updated FROM jobs WHERE status = 'running'").fetchall()
+        self._requeue([row for row in rows if not _pid_alive(row["worker_pid"]) or row["updated"] < stale])
+
+    def requeue_running(self):
+        """
+        Put every running job back in the queue, or fail it once it has been run `max_attempts`
+        times. Meant for startup, when no worker of the queue can be running yet: the pid of
+        a killed worker may have been reused by another process since.
+        """
+        with self._connect() as db:
+            rows = db.execute("SELECT id, worker_pid, attempts FROM jobs WHERE status = 'running'").fetchall()
+        self._requeue(rows)
+
+    def _requeue(self, rows: list):
+        for row in rows:
+            if row["attempts"] >= self.max_attempts:
+                self.fail(row["id"], f"Worker stopped while running the job {row['attempts']} times")
+                continue
+            with self._connect() as db:
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', worker_pid = NULL, updated = ? WHERE id = ? AND status = 'running'",
+                    (time.time(), row["id"]),
+                )
+
+
+def _pid_alive(pid: int) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def run_job(
+    queue: JobQueue,
+    job: dict,
+    registry,
+    workers: int = 1,
+    batch_size: int = 8,
+    github_top_k: int = 5,
+    add_to_pool: bool = False,
+):
+    """
+    Extract and rank the documents of a claimed job, recording progress as candidates are scored.
+    With `add_to_pool` the ranked resumes are kept in the registry's candidate pool.
+    """
+    documents = job["documents"]
+    if job["path_type"] == "stream":
+        contents = []
+        for filename, file_path in documents:
+            with open(file_path, "rb") as f:
+                contents.append((filename, f.read()))
+        documents = contents
+
+    pdf_reader = PDF(documents, cache=registry.cache).process_pdf(path_type=job["path_type"], workers=workers)
+    resumes = [resume for resume in pdf_reader if resume["status"]]
+    error_files = [[resume["filename"], resume["text"]] for resume in pdf_reader if not resume["status"]]
+    queue.progress(job["id"], len(error_files))
+
+    ranking = {}
+    for event, index, value in registry.resume_ranker.iter_similarity(job["job_description"], resumes, batch_size):
+        if event == "candidate" and index % batch_size == 0:
+            queue.progress(job["id"], len(error_files) + index)
+        elif event == "ranking":
+            ranking = registry.github_enricher.enrich(value, top_k=github_top_k)
+    if add_to_pool:
+        registry.resume_ranker.add_to_pool(registry.candidate_pool, resumes)
+    queue.complete(job["id"], ranking, error_files)
+
+
+def _send_heartbeats(queue: JobQueue, job_id: str, finished: threading.Event):
+    while not finished.wait(queue.stale_after / 4):
+        queue.heartbeat(job_id)
+
+
+def work(queue_path: str, poll_interval: float = 1.0, pdf_workers: int = 1):
+    """
+    Worker loop: load the ranking models once, then process queued jobs until the process
+    receives SIGTERM or SIGINT. The job being run is finished first.
+    """
+    stopping = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: stopping.append(signum))
+
+    queue = JobQueue(queue_path)
+    add_to_pool = os.getenv("CANDIDATE_POOL_ENABLED", "1") == "1"
+    registry = ModelRegistry()
+    registry.check()
+    # Jobs only rank: the resume checker (and its LanguageTool JVM) is never started here
+    registry.resume_ranker.sentence_embedding(registry.warmup_text, [registry.warmup_text])
+    if pdf_workers > 1:
+        extraction_pool(pdf_workers)
+    try:
+        while not stopping:
+            queue.requeue_stale()
+            job = queue.claim()
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            finished = threading.Event()
+            threading.Thread(target=_send_heartbeats, args=(queue, job["id"], finished), daemon=True).start()
+            try:
+                run_job(queue, job, registry, workers=pdf_workers, add_to_pool=add_to_pool)
+            except Exception as e:
+                queue.fail(job["id"], str(e))
+            finally:
+                finished.set()
+    finally:
+        shutdown_extraction_pool()
+        registry.close()
+
+
+class JobWorkers:
+    """
+    Class to run a fixed number of worker processes for a job queue.
+
+    Args:
+        queue_path (str): Path of the job queue SQLite file
+        count (int): Number of worker processes
+        pdf_workers (int): Number of PDF extraction processes per worker. Defaults to 1.
+        stop_timeout (float): Seconds `stop` waits for the current jobs before killing the
+            workers. Defaults to 10.
+    """
+
+    def __init__(self, queue_path: str, count: int, pdf_workers: int = 1, stop_timeout: float = 10.0):
+        self.queue_path = queue_path
+        self.count = count
+        self.pdf_workers = pdf_workers
+        self.stop_timeout = stop_timeout
+        self.processes = []
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        for _ in range(self.count):
+            process = context.Process(
+                target=work, args=(self.queue_path,), kwargs={"pdf_workers": self.pdf_workers}, daemon=False
+            )
+            process.start()
+            self.processes.append(process)
+
+    def stop(self, timeout: float = None):
+        """
+        Ask the workers to stop after their current job, killing the ones still running after
+        `timeout` seconds (defaults to `stop_timeout`). A killed worker's job is queued again
+        by the next worker.
+        """
+        for process in self.processes:
+            process.terminate()
+        if timeout is None:
+            timeout = self.stop_timeout
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.processes = []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run ranking job workers")
+    parser.add_argument("--queue", default=os.getenv("JOB_QUEUE_PATH", "./.cache/jobs.sqlite3"))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--pdf-workers", type=int, default=1)
+    parser.add_argument(
+        "--stop-timeout",
+        type=float,
+        default=float(os.getenv("JOB_STOP_TIMEOUT", 10)),
+        help="Seconds to let the current jobs finish on SIGTERM/SIGINT before killing the workers",
+    )
+    args = parser.parse_args()
+
+    # No worker of this queue runs yet, so jobs left running were abandoned by a killed one
+    JobQueue(args.queue).requeue_running()
+    job_workers = JobWorkers(args.queue, args.workers, args.pdf_workers, stop_timeout=args.stop_timeout)
+    job_workers.start()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: job_workers.stop())
+    for process in job_workers.processes:
+        process.join()
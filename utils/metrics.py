@@ -0,0 +1,274 @@
+"""This file is for timing the pipeline stages and exposing them as Prometheus metrics"""
+
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels
+
+    Args:
+        name (str): Metric name
+        documentation (str): Help text
+        labelnames (tuple): Names of the labels every sample is recorded with
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, e.g. the number of requests in flight
+    """
+
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Counter):
+    """
+    Distribution of observed values over cumulative buckets
+
+    Args:
+        name (str): Metric name
+        documentation (str): Help text
+        labelnames (tuple): Names of the labels every observation is recorded with
+        buckets (tuple): Upper bounds of the buckets, in increasing order
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+        for key, (counts, total) in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """
+    Class to collect stage timings, gauges and counters, and render them in the
+    Prometheus text format.
+
+    Stage timers feed a latency histogram, an in-flight gauge and an error counter per
+    stage. Inside `track_request`, they also add up the time of every stage for the
+    current request, which can be sent back as a `Server-Timing` header.
+
+    When disabled, `timed` returns the decorated function unchanged and `timer` does
+    nothing, so instrumented code runs at full speed.
+
+    Args:
+        enabled (bool): Whether metrics are recorded. Defaults to True.
+        prefix (str): Prefix of the stage metric names. Defaults to 'resume_analyzer'.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "resume_analyzer"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.stage_seconds = self.histogram(f"{prefix}_stage_seconds", "Latency of pipeline stages", ("stage",))
+        self.stage_in_flight = self.gauge(f"{prefix}_stage_in_flight", "Pipeline stages currently running", ("stage",))
+        self.stage_errors = self.counter(f"{prefix}_stage_errors_total", "Pipeline stages that raised", ("stage",))
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def register_collector(self, collector):
+        """
+        Add a function called on every render, for values read at scrape time (e.g. cache counters)
+
+        Args:
+            collector (callable): Returns (name, type, documentation, [(labels, value), ...]) tuples
+        """
+        self._collectors.append(collector)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Time a block of code as a pipeline stage
+
+        Args:
+            stage (str): Stage name, e.g. 'ner.process_text'
+        """
+        if not self.enabled:
+            yield
+            return
+        self.stage_in_flight.inc(stage=stage)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.stage_errors.inc(stage=stage)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_in_flight.dec(stage=stage)
+            self.stage_seconds.observe(elapsed, stage=stage)
+            timings = _request_timings.get()
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + elapsed
+
+    def timed(self, stage: str):
+        """
+        Decorator timing every call of a function or coroutine function as a pipeline stage
+
+        Args:
+            stage (str): Stage name, e.g. 'ner.process_text'
+        """
+
+        def decorator(fn):
+            if not self.enabled:
+                return fn
+            if inspect.iscoroutinefunction(fn):
+
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(stage):
+                        return await fn(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @contextmanager
+    def track_request(self):
+        """
+        Collect the time spent in every stage while handling one request
+
+        Yields:
+            dict: Seconds spent per stage, filled in as the stages finish
+        """
+        timings = {}
+        token = _request_timings.set(timings)
+        try:
+            yield timings
+        finally:
+            _request_timings.reset(token)
+
+    @staticmethod
+    def server_timing(timings: dict) -> str:
+        """
+        Format stage timings as a `Server-Timing` header value
+        """
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+        """
+        families = [
+            (metric.name, metric.type, metric.documentation, metric.samples())
+            for metric in list(self._metrics.values())
+        ]
+        for collector in self._collectors:
+            families.extend(
+                (name, kind, documentation, [(name, labels, value) for labels, value in values])
+                for name, kind, documentation, values in collector()
+            )
+
+        lines = []
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "1") == "1")
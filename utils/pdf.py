@@ -1,8 +1,66 @@
 """This file if for pdf file or url processing"""
 
+import asyncio
+import multiprocessing
+import os
 import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+
 import fitz
-import requests
+
+from .cache import AnalysisCache
+from .fetcher import PDFFetcher
+from .metrics import metrics
+
+
+PDF_START_METHOD = os.getenv(
+    "PDF_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def extraction_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Get the process pool shared by every parallel extraction in this process, creating it on first use.
+
+    Its processes are started with PDF_START_METHOD ('forkserver' where available, else
+    'spawn'), so they do not inherit the models, threads and locks of the server. The
+    size is fixed by the first call, so call it at startup with the wanted size.
+
+    Args:
+        workers (int): Number of extraction processes
+
+    Returns:
+        ProcessPoolExecutor: The shared pool
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited through fork belongs to the parent, a child starts its own
+        if _pool is None or _pool_pid != os.getpid():
+            context = multiprocessing.get_context(PDF_START_METHOD)
+            if PDF_START_METHOD == "forkserver":
+                # Workers fork from a server that has already imported PyMuPDF
+                context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_extraction_pool():
+    """
+    Stop the shared extraction pool, if this process started one
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(cancel_futures=True)
+        _pool = None
 
 
 class PDF:
@@ -10,11 +68,17 @@ class PDF:
     Class to read and process PDF files.
 
     Args:
-        file_paths (list): List of file paths of PDF files.
+        file_paths (list): List of file paths of PDF files, URLs or (filename, content) tuples.
+        fetcher (PDFFetcher): Downloader used for URLs. A default one is created when not given.
+        cache (AnalysisCache): Cache for extraction results, keyed by the PDF content.
     """
 
-    def __init__(self, file_paths: list):
+    version = "1"
+
+    def __init__(self, file_paths: list, fetcher: PDFFetcher = None, cache: AnalysisCache = None):
         self.file_paths = file_paths
+        self.fetcher = fetcher or PDFFetcher()
+        self.cache = cache
         self.output_text = []
 
     def clean_text(self, text: str) -> str:
@@ -64,6 +128,75 @@ class PDF:
         processed_text = pattern.sub(lambda match: replacements[match.group(0)], text)
         return processed_text
 
+    def _open_document(self, file_path: str, path_type: str = "file") -> fitz.Document:
+        """
+        Open a PDF document, downloading it first when it is a URL
+
+        Args:
+            file_path (str | bytes): Path or URL of the PDF file, or its content for 'stream'
+            path_type (str): Type of file to be processed - 'file'(default), 'url', 'stream'
+
+        Returns:
+            fitz.Document: The opened document. The caller is responsible for closing it.
+        """
+        if path_type == "file":
+            return fitz.open(filename=file_path, filetype="pdf")
+        elif path_type == "url":
+            content = self.fetcher.fetch_all_sync([file_path])[0]
+            if isinstance(content, Exception):
+                raise content
+            return fitz.open(stream=content, filetype="pdf")
+        elif path_type == "stream":
+            return fitz.open(stream=file_path, filetype="pdf")
+        raise ValueError(f"Unknown path type: {path_type}")
+
+    def _document_text(self, doc: fitz.Document) -> str:
+        """
+        Extract the cleaned text of an opened document
+
+        Args:
+            doc (fitz.Document): Opened PDF document
+
+        Returns:
+            str: Text extracted from the PDF.
+        """
+        file_text = ""
+        for page in doc:
+            file_text += page.get_text()
+        return self.clean_text(file_text)
+
+    def _document_hyperlinks(self, doc: fitz.Document) -> list:
+        """
+        Extract the hyperlinks of an opened document
+
+        Args:
+            doc (fitz.Document): Opened PDF document
+
+        Returns:
+            list: List of hyperlinks found in the PDF
+        """
+        hyperlinks = []
+        for page in doc:
+            for annotation in page.links():
+                hyperlink = annotation.get("uri")
+                if hyperlink:
+                    hyperlinks.append(hyperlink)
+        return hyperlinks
+
+    def extract(self, file_path: str, path_type: str = "file") -> tuple[str, list]:
+        """
+        Read the text and hyperlinks of a PDF file in a single pass
+
+        Args:
+            file_path (str | bytes): Path or URL of the PDF file, or its content for 'stream'
+            path_type (str): Type of file to be processed - 'file'(default), 'url', 'stream'
+
+        Returns:
+            tuple: Text extracted from the PDF and the list of hyperlinks found in it
+        """
+        with self._open_document(file_path, path_type) as doc:
+            return self._document_text(doc), self._document_hyperlinks(doc)
+
     def read_pdf(self, file_path: str, path_type: str = "file") -> str:
         """
         Read text from a PDF file.
@@ -75,16 +208,8 @@ class PDF:
         Returns:
             str: Text extracted from the PDF.
         """
-        file_text = ""
-        if path_type == "file":
-            doc = fitz.open(filename=file_path, filetype="pdf")
-        elif path_type == "url":
-            res = requests.get(file_path, timeout=10)
-            doc = fitz.open(stream=res.content, filetype="pdf")
-        for page in doc:
-            text = page.get_text()
-            file_text += text
-        return self.clean_text(file_text)
+        with self._open_document(file_path, path_type) as doc:
+            return self._document_text(doc)
 
     def get_hyperlinks(self, file_path: str, path_type: str = "file") -> list:
         """
@@ -97,59 +222,285 @@ class PDF:
         Returns:
             list: List of hyperlinks found in the PDF
         """
-        if path_type == "file":
-            doc = fitz.open(filename=file_path, filetype="pdf")
-        elif path_type == "url":
-            res = requests.get(file_path, timeout=10)
-            doc = fitz.open(stream=res.content, filetype="pdf")
+        with self._open_document(file_path, path_type) as doc:
+            return self._document_hyperlinks(doc)
 
-        hyperlinks = []
+    def resolve_url(self, file: str) -> str:
+        """
+        Convert a Google Drive view link into a direct download link.
 
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            annotations = page.links()
+        Args:
+            file (str): Google Drive link of the PDF file
 
-            for annotation in annotations:
-                hyperlink = annotation.get("uri")
-                if hyperlink:
-                    hyperlinks.append(hyperlink)
+        Returns:
+            str: Download link, or None if the link is not a valid Drive file link
+        """
+        if "/file/" in file and "/view" in file:
+            fileid = re.findall(pattern=r'[-\w]{25,}', string=file)[0]
+            return f"https://drive.google.com/uc?id={fileid}"
+        return None
 
-        doc.close()
-        return hyperlinks
+    def process_file(self, file, path_type: str = "file", filename: str = None) -> dict:
+        """
+        Process a single PDF file.
+
+        Args:
+            file (str | bytes): Path or URL of the PDF file, or its content for 'stream'
+            path_type (str): Type of file to be processed - 'file'(default), 'url', 'stream'
+            filename (str): Name reported for the file on errors. Defaults to `file`.
+
+        Returns:
+            dict: Dictionary with status, text, and links for the processed PDF.
+        """
+        if path_type == "url":
+            url = self.resolve_url(file)
+            if url is None:
+                return {
+                    "status": False,
+                    "text": "Not a valid URL. Ensure that it is a drive link and has view access",
+                    "filename": file,
+                }
+            file = url
+        try:
+            text, links = self.extract(file_path=file, path_type=path_type)
+            return {"status": True, "text": text, "links": links}
+        except Exception as e:
+            return {"status": False, "text": str(e), "filename": filename or file}
+
+    def _process_files(self, files: list, path_type: str, workers: int, filenames: list = None) -> list:
+        """
+        Process files in input order, in the shared extraction pool when more than one worker is requested
+        """
+        filenames = filenames or [None] * len(files)
+        if workers > 1 and len(files) > 1:
+            return list(
+                _ordered_map(
+                    extraction_pool(workers), _process_file, zip(files, [path_type] * len(files), filenames), workers * 2
+                )
+            )
+        return [
+            self.process_file(file, path_type, filename)
+            for file, filename in zip(files, filenames)
+        ]
+
+    def _process_contents(self, contents: list, filenames: list, workers: int) -> list:
+        """
+        Process in-memory PDFs, skipping the ones whose content is already cached
+
+        Every result carries the content digest of its PDF under 'digest', so later
+        stages can cache their own results for the same document.
+        """
+        digests = [AnalysisCache.digest(content) for content in contents]
+        results = [
+            self.cache.get("extract", digest, self.version) if self.cache else None
+            for digest in digests
+        ]
+        missing = [index for index, result in enumerate(results) if result is None]
+        extracted = self._process_files(
+            [contents[index] for index in missing], "stream", workers, [filenames[index] for index in missing]
+        )
+        for index, result in zip(missing, extracted):
+            if result["status"] and self.cache:
+                self.cache.set("extract", digests[index], self.version, result)
+            results[index] = result
+        return [dict(result, digest=digest) for result, digest in zip(results, digests)]
+
+    async def _download(self) -> list:
+        """
+        Download all Drive links concurrently
+
+        Returns:
+            list: Tuples of download URL and file content, or error dictionaries for failed links
+        """
+        urls = [self.resolve_url(file) for file in self.file_paths]
+        contents = iter(await self.fetcher.fetch_all([url for url in urls if url]))
+        downloads = []
+        for file, url in zip(self.file_paths, urls):
+            if url is None:
+                downloads.append(self.process_file(file, path_type="url"))
+            else:
+                downloads.append(_download_result(url, next(contents)))
+        return downloads
+
+    def _prefetch(self) -> tuple[list, threading.Event]:
+        """
+        Start downloading all Drive links concurrently on a background thread
+
+        Returns:
+            tuple: One future per link in input order, resolving to a tuple of download URL and
+                file content or to an error dictionary, and an event that cancels the downloads still running
+        """
+        urls = [self.resolve_url(file) for file in self.file_paths]
+        futures = [Future() for _ in self.file_paths]
+        positions = []
+        for position, (file, url) in enumerate(zip(self.file_paths, urls)):
+            if url is None:
+                futures[position].set_result(self.process_file(file, path_type="url"))
+            else:
+                positions.append(position)
+
+        def on_result(index, content):
+            position = positions[index]
+            futures[position].set_result(_download_result(urls[position], content))
+
+        cancelled = threading.Event()
+
+        async def download():
+            task = asyncio.create_task(self.fetcher.fetch_all([urls[position] for position in positions], on_result))
+            while not task.done():
+                if cancelled.is_set():
+                    task.cancel()
+                await asyncio.wait([task], timeout=0.1)
+            await task
+
+        def run():
+            try:
+                asyncio.run(download())
+            except BaseException as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+        threading.Thread(target=run, name="pdf-prefetch", daemon=True).start()
+        return futures, cancelled
+
+    def _extract_downloads(self, downloads: list, workers: int) -> list:
+        """
+        Extract the downloaded or read files and merge them with the failed ones in input order
+        """
+        ok = [item for item in downloads if isinstance(item, tuple)]
+        extracted = iter(
+            self._process_contents([content for _, content in ok], [url for url, _ in ok], workers)
+        )
+        return [item if isinstance(item, dict) else next(extracted) for item in downloads]
 
-    def process_pdf(self, path_type: str = "file"):
+    def _process_downloads(self, downloads: list, workers: int) -> list:
+        self.output_text.extend(self._extract_downloads(downloads, workers))
+        return self.output_text
+
+    @metrics.timed("pdf.process_pdf")
+    def process_pdf(self, path_type: str = "file", workers: int = 1):
         """
         Process PDF files.
 
         Args:
-            path_type (str): Type of file to be processed - 'file'(default), 'url'
+            path_type (str): Type of file to be processed - 'file'(default), 'url', 'stream'.
+                For 'stream', `file_paths` holds (filename, content) tuples of in-memory PDFs.
+            workers (int): Number of files processed in parallel in the shared extraction
+                pool (see `extraction_pool`). URLs are downloaded concurrently regardless. Defaults to 1.
 
         Returns:
             list: List containing dictionaries with status, text, and links for each processed PDF.
         """
-        for file in self.file_paths:
-            if path_type == "url":
-                if "/file/" in file and "/view" in file:
-                    fileid = re.findall(pattern=r'[-\w]{25,}', string=file)[0]
-                    file = f"https://drive.google.com/uc?id={fileid}"
-                else:
-                    return {
-                        "status": False,
-                        "text": "Not a valid URL. Ensure that it is a drive link and has view access",
-                        "filename": file,
-                    }
-            try:
-                self.output_text.append(
-                    {
-                        "status": True,
-                        "text": self.read_pdf(file_path=file, path_type=path_type),
-                        "links": self.get_hyperlinks(
-                            file_path=file, path_type=path_type
-                        ),
-                    }
-                )
-            except Exception as e:
-                self.output_text.append(
-                    {"status": False, "text": str(e), "filename": file}
-                )
+        if path_type == "url":
+            return self._process_downloads(asyncio.run(self._download()), workers)
+        if path_type == "stream":
+            filenames = [filename for filename, _ in self.file_paths]
+            contents = [content for _, content in self.file_paths]
+            self.output_text.extend(self._process_contents(contents, filenames, workers))
+            return self.output_text
+        if path_type == "file" and self.cache:
+            return self._process_downloads([self._read_file(file) for file in self.file_paths], workers)
+        self.output_text.extend(self._process_files(self.file_paths, path_type, workers))
         return self.output_text
+
+    def iter_pdf(self, path_type: str = "file", workers: int = 1, batch_size: int = 8):
+        """
+        Process PDF files in batches, yielding the results in input order as soon as their batch
+        is extracted, so that a consumer can start on the first files while the rest are read.
+
+        For 'url', every link is downloaded concurrently from the start on a background
+        thread, so downloads run ahead of both the extraction and the consumer. Batches
+        are extracted in the shared extraction pool (see `extraction_pool`) when more than
+        one worker is requested.
+
+        Args:
+            path_type (str): Type of file to be processed - 'file'(default), 'url', 'stream'
+            workers (int): Number of files processed in parallel. Defaults to 1.
+            batch_size (int): Number of files extracted together. Defaults to 8.
+
+        Yields:
+            dict: Dictionary with status, text, and links for each processed PDF, as `process_pdf` returns them
+        """
+        cancelled = None
+        if path_type == "url":
+            futures, cancelled = self._prefetch()
+            downloads = (future.result() for future in futures)
+        elif path_type == "stream":
+            downloads = ((filename, content) for filename, content in self.file_paths)
+        elif path_type == "file":
+            downloads = (self._read_file(file) for file in self.file_paths)
+        else:
+            raise ValueError(f"Unknown path type: {path_type}")
+        try:
+            while batch := list(islice(downloads, batch_size)):
+                with metrics.timer("pdf.process_pdf"):
+                    extracted = self._extract_downloads(batch, workers)
+                self.output_text.extend(extracted)
+                yield from extracted
+        finally:
+            if cancelled is not None:
+                cancelled.set()
+
+    def _read_file(self, file: str):
+        """
+        Read a local PDF into memory
+
+        Returns:
+            tuple | dict: Tuple of the path and file content, or an error dictionary if it cannot be read
+        """
+        try:
+            with open(file, "rb") as f:
+                return file, f.read()
+        except OSError as e:
+            return {"status": False, "text": str(e), "filename": file}
+
+    async def aprocess_pdf(self, path_type: str = "file", workers: int = 1, executor=None):
+        """
+        Process PDF files from a running event loop. Same as `process_pdf`.
+
+        Args:
+            executor (BlockingExecutor): Runs the text extraction off the event loop. URLs
+                are still downloaded on the loop. Defaults to None, extracting in place.
+        """
+        if path_type == "url":
+            with metrics.timer("pdf.process_pdf"):
+                downloads = await self._download()
+                if executor is None:
+                    return self._process_downloads(downloads, workers)
+                return await executor.run(self._process_downloads, downloads, workers)
+        if executor is None:
+            return self.process_pdf(path_type, workers)
+        return await executor.run(self.process_pdf, path_type, workers)
+
+
+def _download_result(url: str, content) -> tuple | dict:
+    """
+    Pair a downloaded file with its URL, or turn a failed download into an error dictionary
+    """
+    if isinstance(content, Exception):
+        return {"status": False, "text": str(content) or repr(content), "filename": url}
+    return url, content
+
+
+def _process_file(file, path_type: str, filename: str = None) -> dict:
+    """
+    Module level entry point so that pool workers can process a file without pickling a PDF instance
+    """
+    return PDF([]).process_file(file, path_type, filename)
+
+
+def _ordered_map(executor, fn, items, max_in_flight: int):
+    """
+    Map `fn` over the argument tuples in `items` on `executor` with at most `max_in_flight` pending tasks
+
+    Yields:
+        dict: Results in the same order as `items`
+    """
+    pending = deque()
+    for args in items:
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, *args))
+    while pending:
+        yield pending.popleft().result()
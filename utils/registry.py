@@ -0,0 +1,241 @@
+"""Process-wide registry for the models used by the app"""
+
+import os
+import threading
+from typing import TYPE_CHECKING
+
+import models
+from .cache import AnalysisCache
+from .ann_index import IVFIndex
+from .candidate_pool import CandidatePool
+from .github_statistics import GitHubEnricher
+
+if TYPE_CHECKING:
+    from models import CustomNER, JobClassifier
+    from .resume_check import ResumeChecker
+    from .resume_ranker import ResumeRanker
+
+
+class ModelRegistry:
+    """
+    Class to load the heavy models once per process and share them between requests.
+
+    Models are created lazily on first access, and their modules (with torch, spaCy,
+    nltk or LanguageTool) are only imported then, so `load` only has to be called
+    when the loading cost should be paid up front (e.g. at application startup).
+    """
+
+    fork_safe = ("ner", "ranking_ner", "job_classifier", "resume_ranker")
+
+    # Opened on first use only: the candidate pool is read from disk and the ANN index
+    # clustered from it, which `load` would otherwise repeat in every process
+    on_demand = ("candidate_pool", "ann_index")
+
+    warmup_text = (
+        "John Doe. Python Developer. Built and deployed machine learning models "
+        "at Acme Corp. B.Tech in Computer Science. john.doe@example.com"
+    )
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._models = {}
+        self._factories = {
+            "ner": lambda: models.CustomNER(backend=os.getenv("NER_BACKEND", "accurate")),
+            "ranking_ner": self._ranking_ner,
+            "job_classifier": lambda: models.JobClassifier(),
+            "resume_checker": self._resume_checker,
+            "resume_ranker": self._resume_ranker,
+            "cache": lambda: AnalysisCache(
+                path=os.getenv("ANALYSIS_CACHE_PATH", "./.cache/analysis.sqlite3"),
+                max_bytes=int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+            ),
+            "candidate_pool": lambda: CandidatePool(
+                os.getenv("CANDIDATE_POOL_DIR", "./.cache/candidate_pool"),
+                dtype=os.getenv("CANDIDATE_POOL_DTYPE", "float32"),
+            ),
+            "ann_index": lambda: IVFIndex.from_pool(
+                self.candidate_pool, n_probe=int(os.getenv("ANN_N_PROBE", 8))
+            ),
+            "github_enricher": lambda: GitHubEnricher(),
+        }
+
+    def get(self, name: str):
+        """
+        Get a shared model instance, creating it on first use
+
+        Args:
+            name (str): Name of the model - 'ner', 'ranking_ner', 'job_classifier', 'resume_checker', 'resume_ranker', 'cache', 'candidate_pool', 'ann_index',
+                'github_enricher'
+
+        Returns:
+            object: The shared model instance
+        """
+        if name not in self._models:
+            with self._lock:
+                if name not in self._models:
+                    self._models[name] = self._factories[name]()
+        return self._models[name]
+
+    @staticmethod
+    def ner_backends() -> dict:
+        """
+        Get the NER backend configured for each NER model
+
+        Returns:
+            dict: Backend name of 'ner' (NER_BACKEND) and 'ranking_ner' (RANKING_NER_BACKEND, defaults to NER_BACKEND)
+        """
+        backend = os.getenv("NER_BACKEND", "accurate")
+        return {"ner": backend, "ranking_ner": os.getenv("RANKING_NER_BACKEND", backend)}
+
+    def check(self):
+        """
+        Check that the model of every configured NER backend exists, so that a missing
+        one fails at startup rather than on the first request
+
+        Raises:
+            ValueError: If a backend is unknown
+            FileNotFoundError: If the model directory of a backend is missing
+        """
+        for name, backend in self.ner_backends().items():
+            if backend not in models.NER_BACKENDS:
+                raise ValueError(f"Unknown NER backend '{backend}' for {name}, expected one of {list(models.NER_BACKENDS)}")
+            path = models.NER_BACKENDS[backend]
+            if not os.path.isdir(path):
+                hint = (
+                    "Train it with 'python models/ner/train_fast.py' or use the 'accurate' backend"
+                    if backend == "fast"
+                    else "Run the App from the repository root"
+                )
+                raise FileNotFoundError(f"Model of the '{backend}' NER backend ({name}) not found at {path}. {hint}")
+
+    def _ranking_ner(self) -> "CustomNER":
+        backends = self.ner_backends()
+        # Compare the configuration rather than `self.ner.backend`, which would load the
+        # single-resume model even when ranking uses another backend. On a match they are
+        # the same model, so it is loaded once and shared.
+        if backends["ranking_ner"] == backends["ner"]:
+            return self.ner
+        return models.CustomNER(backend=backends["ranking_ner"])
+
+    def _resume_checker(self) -> "ResumeChecker":
+        from .resume_check import ResumeChecker
+
+        return ResumeChecker(
+            grammar_workers=int(os.getenv("GRAMMAR_WORKERS", 4)),
+            grammar_time_budget=float(os.environ["GRAMMAR_TIME_BUDGET"]) if "GRAMMAR_TIME_BUDGET" in os.environ else None,
+            language_tool_url=os.getenv("LANGUAGE_TOOL_URL"),
+        )
+
+    def _resume_ranker(self) -> "ResumeRanker":
+        from .resume_ranker import ResumeRanker
+
+        return ResumeRanker(
+            ner=self.ranking_ner,
+            cache=self.cache,
+            job_classifier=self.job_classifier,
+            chunk_tokens=int(os.environ["RANKER_CHUNK_TOKENS"]) if "RANKER_CHUNK_TOKENS" in os.environ else None,
+            pooling=os.getenv("RANKER_POOLING", "mean"),
+            quantize=os.getenv("RANKER_QUANTIZE", "0") == "1",
+            threads=int(os.environ["RANKER_THREADS"]) if "RANKER_THREADS" in os.environ else None,
+            embedding_dtype=os.getenv("RANKER_EMBEDDING_DTYPE", "float32"),
+        )
+
+    def is_loaded(self, name: str) -> bool:
+        """
+        Check whether a model has been created, without creating it
+        """
+        return name in self._models
+
+    @property
+    def ner(self) -> "CustomNER":
+        """
+        NER model of single-resume analysis, selected with NER_BACKEND
+        """
+        return self.get("ner")
+
+    @property
+    def ranking_ner(self) -> "CustomNER":
+        """
+        NER model of bulk recruiter ranking, selected with RANKING_NER_BACKEND (defaults to NER_BACKEND)
+        """
+        return self.get("ranking_ner")
+
+    @property
+    def job_classifier(self) -> "JobClassifier":
+        return self.get("job_classifier")
+
+    @property
+    def resume_checker(self) -> "ResumeChecker":
+        return self.get("resume_checker")
+
+    @property
+    def resume_ranker(self) -> "ResumeRanker":
+        return self.get("resume_ranker")
+
+    @property
+    def cache(self) -> AnalysisCache:
+        return self.get("cache")
+
+    @property
+    def candidate_pool(self) -> CandidatePool:
+        return self.get("candidate_pool")
+
+    @property
+    def ann_index(self) -> IVFIndex:
+        return self.get("ann_index")
+
+    @property
+    def github_enricher(self) -> GitHubEnricher:
+        return self.get("github_enricher")
+
+    def load(self, warmup: bool = True):
+        """
+        Load every registered model except the `on_demand` ones and optionally warm them up
+
+        Args:
+            warmup (bool): Run a dummy inference through each model after loading
+        """
+        self.check()
+        for name in self._factories:
+            if name not in self.on_demand:
+                self.get(name)
+        if warmup:
+            self.warmup()
+
+    def preload(self):
+        """
+        Load the models whose weights can be shared with forked worker processes
+        (see `fork_safe`), without warming them up.
+
+        Meant for a server master process before it forks its workers. No inference runs
+        here, so torch's OpenMP thread pool is only started in the workers; LanguageTool
+        (a JVM subprocess with client threads) is left to each worker.
+        """
+        self.check()
+        for name in self.fork_safe:
+            self.get(name)
+
+    def warmup(self):
+        """
+        Run a dummy inference through each model so that lazy initialisation
+        (weights, tokenizers, JIT paths) does not land on the first request
+        """
+        text = self.warmup_text
+        self.ner.process_text(text)
+        self.ranking_ner.process_text(text)
+        self.job_classifier.predict_job_role(text)
+        self.resume_checker.perform_all_checks(text)
+        self.resume_ranker.sentence_embedding(text, [text])
+
+    def close(self):
+        """
+        Release the resources held by the loaded models
+        """
+        with self._lock:
+            checker = self._models.pop("resume_checker", None)
+            if checker is not None:
+                checker.close()
+            cache = self._models.pop("cache", None)
+            if cache is not None:
+                cache.close()
+            self._models.clear()
@@ -1,20 +1,58 @@
+import hashlib
 import re
-import nltk
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import cached_property
 from nltk.tokenize import word_tokenize, sent_tokenize
-from nltk.tag import pos_tag
+from nltk.tag import pos_tag_sents
 import language_tool_python
 
-# from spellchecker import SpellChecker
+from .bootstrap import ensure_nltk_data, use_language_tool_assets
+from .metrics import metrics
 
-nltk.download("averaged_perceptron_tagger")
-nltk.download("punkt")
+# from spellchecker import SpellChecker
 
 
 class ResumeChecker:
-    def __init__(self):
-        self.tool = language_tool_python.LanguageTool("en-US")
+    def __init__(
+        self,
+        grammar_workers: int = 4,
+        grammar_chunk_chars: int = 1000,
+        grammar_cache_size: int = 4096,
+        grammar_time_budget: float = None,
+        language_tool_url: str = None,
+    ):
+        """
+        Initialize the ResumeChecker with a long-lived LanguageTool server.
 
-        self.strong_action_verbs = [
+        Args:
+            grammar_workers (int): Number of text chunks checked concurrently. Defaults to 4.
+            grammar_chunk_chars (int): Approximate size of the chunks sent to LanguageTool. Defaults to 1000.
+            grammar_cache_size (int): Number of chunk results kept in memory. Defaults to 4096.
+            grammar_time_budget (float): Seconds after which grammar checking returns the errors
+                of the chunks finished so far. No limit when not given. Chunks still running
+                then cannot be interrupted and hold their worker until LanguageTool answers, so
+                later checks queue behind them while the server is slow.
+            language_tool_url (str): URL of a running LanguageTool server shared with other
+                processes, e.g. 'http://127.0.0.1:8081'. A local server is started when not given.
+        """
+        ensure_nltk_data()
+        if language_tool_url:
+            self.tool = language_tool_python.LanguageTool("en-US", remote_server=language_tool_url)
+        else:
+            use_language_tool_assets()
+            self.tool = language_tool_python.LanguageTool("en-US")
+        self.grammar_chunk_chars = grammar_chunk_chars
+        self.grammar_cache_size = grammar_cache_size
+        self.grammar_time_budget = grammar_time_budget
+        self._grammar_executor = ThreadPoolExecutor(max_workers=grammar_workers)
+        self._grammar_cache = OrderedDict()
+        self.grammar_cache_hits = 0
+        self.grammar_cache_misses = 0
+        self._grammar_lock = threading.Lock()
+
+        self.strong_action_verbs = {
             "Accelerated",
             "Achieved",
             "Attained",
@@ -77,9 +115,9 @@ class ResumeChecker:
             "Executed",
             "Delivered",
             "Improved",
-        ]
+        }
 
-        self.personal_pronouns = [
+        self.personal_pronouns = {
             "i",
             "you",
             "he",
@@ -104,32 +142,117 @@ class ResumeChecker:
             "hers",
             "ours",
             "theirs",
-        ]
+        }
+
+    @metrics.timed("check.pos_tagging")
+    def analyse(self, text: str) -> "TextAnalysis":
+        """
+        Tokenize and POS tag the text once so that all checks can share the result
+
+        Args:
+            text (str): Text to analyse.
+
+        Returns:
+            TextAnalysis: Sentences, tokens, POS tags and their offsets in the text.
+        """
+        sentences = sent_tokenize(text)
+        tokens = [word_tokenize(sentence) for sentence in sentences]
+        return TextAnalysis(text, sentences, tokens, pos_tag_sents(tokens))
+
+    def _grammar_chunks(self, text: str) -> list:
+        """
+        Split the text at line breaks into chunks of roughly `grammar_chunk_chars` characters
 
-    def grammar_check(self, text: str) -> list:
+        Returns:
+            list: (offset, chunk) tuples covering the whole text
+        """
+        chunks = []
+        start = 0
+        end = 0
+        for line in text.splitlines(keepends=True):
+            if end > start and end - start + len(line) > self.grammar_chunk_chars:
+                chunks.append((start, text[start:end]))
+                start = end
+            end += len(line)
+        if end > start:
+            chunks.append((start, text[start:end]))
+        return chunks
+
+    def _check_chunk(self, chunk: str) -> list:
+        """
+        Run LanguageTool over one chunk, reusing the result of an identical chunk
+
+        Returns:
+            list: Matches of the chunk as lists, with offsets relative to the chunk
+        """
+        key = hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+        with self._grammar_lock:
+            if key in self._grammar_cache:
+                self._grammar_cache.move_to_end(key)
+                self.grammar_cache_hits += 1
+                return self._grammar_cache[key]
+            self.grammar_cache_misses += 1
+
+        matches = [list(match) for match in self.tool.check(chunk)]
+        with self._grammar_lock:
+            self._grammar_cache[key] = matches
+            while len(self._grammar_cache) > self.grammar_cache_size:
+                self._grammar_cache.popitem(last=False)
+        return matches
+
+    @metrics.timed("check.grammar")
+    def grammar_check(self, text: str, time_budget: float = None) -> list:
         """
         Check grammar in the text
 
+        The text is split into chunks that are checked concurrently against the shared
+        LanguageTool server. Results of chunks seen before are reused.
+
         Args:
             text (str): Text to perform grammar check on.
+            time_budget (float): Seconds to wait for the chunks before returning partial
+                results. Defaults to `grammar_time_budget`.
 
         Returns:
             list: List of detected grammatical errors.
+
+        Raises:
+            Exception: The error of the first chunk when every chunk failed. Failed chunks
+                are otherwise skipped and counted under the 'check.grammar.chunk' stage errors.
         """
-        matches = self.tool.check(text)
+        chunks = self._grammar_chunks(text)
+        futures = [self._grammar_executor.submit(self._check_chunk, chunk) for _, chunk in chunks]
+        if time_budget is None:
+            time_budget = self.grammar_time_budget
+        wait(futures, timeout=time_budget)
+
+        matches = []
+        failures = []
+        for (start, _), future in zip(chunks, futures):
+            if not future.done():
+                # Only queued chunks are cancelled: a running one keeps its worker until
+                # LanguageTool answers
+                future.cancel()
+            elif future.exception() is not None:
+                failures.append(future.exception())
+                metrics.stage_errors.inc(stage="check.grammar.chunk")
+            else:
+                matches.extend((start + match[5], match) for match in future.result())
+        if failures and len(failures) == len(chunks):
+            raise failures[0]
+        matches.sort(key=lambda item: item[0])
+
         errors = []
-        for match in matches:
-            match = list(match)
+        for _, match in matches:
             if (
                 match[0] != "MORFOLOGIK_RULE_EN_US"
                 and "whitespace" not in match[1]
                 and "consecutive spaces" not in match[1]
             ):
+                message = match[1]
                 if "Did you mean" in match[1]:
                     if '"' in match[1].split("Did you mean")[-1]:
                         message = match[1].split("Did you mean")[0]
-                else:
-                    message = match[1]
                 errors.append(
                     {
                         "message": message,
@@ -141,44 +264,49 @@ class ResumeChecker:
                 )
         return errors
 
-    def check_action_verbs(self, text: str) -> dict:
+    @metrics.timed("check.action_verbs")
+    def check_action_verbs(self, text: str, analysis: "TextAnalysis" = None) -> dict:
         """
         Check for action verbs in the text.
 
         Args:
             text (str): Text to check for action verbs.
+            analysis (TextAnalysis): Shared analysis of the text. Computed when not given.
 
         Returns:
             dict: Dictionary containing all action verbs found in the text and all strong action verbs.
         """
+        analysis = analysis or self.analyse(text)
         verbs = []
-        tagged_words = pos_tag(word_tokenize(text))
-        for word, pos in tagged_words:
-            if pos.startswith("VB"):
-                verbs.append(word)
+        for tagged_words in analysis.tags:
+            for word, pos in tagged_words:
+                if pos.startswith("VB"):
+                    verbs.append(word)
         strong_verbs = [verb for verb in verbs if verb in self.strong_action_verbs]
         return {"verbs": verbs, "strong_verbs": strong_verbs}
 
-    def check_passive_language(self, text: str) -> list:
+    @metrics.timed("check.passive_language")
+    def check_passive_language(self, text: str, analysis: "TextAnalysis" = None) -> list:
         """
         Check for passive language in the text
 
         Args:
             text (str): Text to check for passive language.
+            analysis (TextAnalysis): Shared analysis of the text. Computed when not given.
 
         Returns:
             list: List of sentences containing passive language.
         """
-        sentences = sent_tokenize(text)
+        analysis = analysis or self.analyse(text)
         passive_sentences = []
-        for sentence in sentences:
-            tagged_words = pos_tag(word_tokenize(sentence))
+        for sentence, tagged_words in zip(analysis.sentences, analysis.tags):
             for i in range(len(tagged_words) - 1):
                 if tagged_words[i][1] == "VBN" and tagged_words[i + 1][0] == "by":
                     passive_sentences.append(sentence)
                     break
         return passive_sentences
 
+    @metrics.timed("check.footprint_links")
     def check_digital_footprint_links(self, text: str) -> dict:
         """
         Check for digital footprint links in the text.
@@ -207,20 +335,24 @@ class ResumeChecker:
                 platform_links[platform] = match.group(0)
         return platform_links
 
-    def check_personal_pronouns(self, text: str) -> list:
+    @metrics.timed("check.personal_pronouns")
+    def check_personal_pronouns(self, text: str, analysis: "TextAnalysis" = None) -> list:
         """
         Check for personal pronouns in the text.
 
         Args:
             text (str): Text to check for personal pronouns.
+            analysis (TextAnalysis): Shared analysis of the text. Computed when not given.
 
         Returns:
             list: List of personal pronouns found in the text.
         """
-        words = word_tokenize(text.lower())
+        analysis = analysis or self.analyse(text)
+        words = [token.lower() for tokens in analysis.tokens for token in tokens]
         pronouns = [word for word in words if word in self.personal_pronouns]
         return pronouns
 
+    @metrics.timed("check.references_section")
     def check_references_section(self, text: str) -> bool:
         """
         Check for the presence of a references section in the text.
@@ -235,6 +367,14 @@ class ResumeChecker:
             return True
         return False
 
+    def close(self):
+        """
+        Stop the grammar check threads and the LanguageTool server
+        """
+        self._grammar_executor.shutdown(cancel_futures=True)
+        self.tool.close()
+
+    @metrics.timed("check.all")
     def perform_all_checks(self, text: str) -> dict:
         """
         Perform all checks on the given text.
@@ -245,11 +385,63 @@ class ResumeChecker:
         Returns:
             dict: Dictionary containing the results of all checks.
         """
+        analysis = self.analyse(text)
         return {
             "grammar": self.grammar_check(text),
-            "action_verbs": self.check_action_verbs(text),
-            "passive_language": self.check_passive_language(text),
+            "action_verbs": self.check_action_verbs(text, analysis),
+            "passive_language": self.check_passive_language(text, analysis),
             "footprint_links": self.check_digital_footprint_links(text),
-            "personal_pronouns": self.check_personal_pronouns(text),
+            "personal_pronouns": self.check_personal_pronouns(text, analysis),
             "references_section": self.check_references_section(text),
         }
+
+
+class TextAnalysis:
+    """
+    Sentences, tokens and POS tags of a text, shared by the checks of `ResumeChecker`.
+
+    Args:
+        text (str): Analysed text.
+        sentences (list): Sentences of the text.
+        tokens (list): Tokens of every sentence.
+        tags (list): (token, POS tag) pairs of every sentence.
+    """
+
+    def __init__(self, text: str, sentences: list, tokens: list, tags: list):
+        self.text = text
+        self.sentences = sentences
+        self.tokens = tokens
+        self.tags = tags
+
+    @cached_property
+    def sentence_offsets(self) -> list:
+        """
+        (start, end) offsets of every sentence in the text, computed on first access
+        """
+        return self._offsets(self.text, self.sentences, 0)
+
+    @cached_property
+    def token_offsets(self) -> list:
+        """
+        (start, end) offsets of the tokens of every sentence in the text, computed on first access
+        """
+        return [
+            self._offsets(self.text, sentence_tokens, start)
+            for sentence_tokens, (start, _) in zip(self.tokens, self.sentence_offsets)
+        ]
+
+    @staticmethod
+    def _offsets(text: str, pieces: list, start: int) -> list:
+        """
+        Get the (start, end) offsets of consecutive pieces of the text. Pieces that the
+        tokenizer rewrote (e.g. quotes) get an empty span at the current position.
+        """
+        offsets = []
+        for piece in pieces:
+            position = text.find(piece, start)
+            if position == -1:
+                offsets.append((start, start))
+                continue
+            offsets.append((position, position + len(piece)))
+            start = position + len(piece)
+        return offsets
@@ -1,10 +1,18 @@
+import torch
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 
 import re
+from itertools import islice
 
-from models import CustomNER
-from . import GitHubStatistics
+import numpy as np
+
+from models import CustomNER, JobClassifier
+from .bootstrap import sentence_transformer_path
+from .cache import AnalysisCache
+from .ann_index import IVFIndex
+from .candidate_pool import CandidatePool
+from .metrics import metrics
 
 
 class ResumeRanker:
@@ -12,29 +20,320 @@ class ResumeRanker:
     Class to calculate the similarity score between a job description and multiple resumes.
     """
 
-    def __init__(self, model_name="bert-base-nli-mean-tokens"):
+    embedding_dtypes = ("float32", "float16")
+
+    def __init__(
+        self,
+        model_name="bert-base-nli-mean-tokens",
+        ner: CustomNER = None,
+        ner_batch_size: int = 16,
+        cache: AnalysisCache = None,
+        chunk_tokens: int = None,
+        chunk_overlap: int = 32,
+        pooling: str = "mean",
+        top_n: int = 3,
+        batch_size: int = 64,
+        job_classifier: JobClassifier = None,
+        quantize: bool = False,
+        threads: int = None,
+        embedding_dtype: str = "float32",
+    ):
         """
         Initialize the ResumeSimilarityChecker with a pre-trained SentenceTransformer model.
 
         Args:
         model_name (str): Name of the SentenceTransformer model to be used. Defaults to 'bert-base-nli-mean-tokens'.
+        ner (CustomNER): Shared NER model. Loaded on first use when not given.
+        ner_batch_size (int): Number of resumes sent through the NER pipeline together. Defaults to 16.
+        cache (AnalysisCache): Cache for resume embeddings and entities, keyed by the resume content.
+        chunk_tokens (int): Split resumes into windows of this many tokens and pool the window embeddings,
+            instead of encoding each resume as one (truncated) sentence. Use 0 for the model's maximum
+            sequence length. Chunking is off when not given.
+        chunk_overlap (int): Number of tokens shared by consecutive windows. Defaults to 32.
+        pooling (str): How window embeddings are pooled per resume - 'mean'(default), 'max', 'top-n'.
+            'top-n' averages the `top_n` windows closest to the job description.
+        top_n (int): Number of windows averaged by 'top-n' pooling. Defaults to 3.
+        batch_size (int): Number of sentences encoded together. Defaults to 64.
+        job_classifier (JobClassifier): When given, every ranked candidate gets a predicted 'job_role'.
+        quantize (bool): Quantize the linear layers of the encoder to int8 for faster CPU inference.
+            Scores drift slightly from the fp32 model. Defaults to False.
+        threads (int): Number of threads used by torch for inference. Torch's default when not given.
+        embedding_dtype (str): Precision of the cached resume embeddings - 'float32'(default), 'float16'.
+            Embeddings are returned as float32 either way.
         """
-        self.model = SentenceTransformer(model_name)
+        if embedding_dtype not in self.embedding_dtypes:
+            raise ValueError(
+                f"Unsupported embedding_dtype '{embedding_dtype}', expected one of {list(self.embedding_dtypes)}"
+            )
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(sentence_transformer_path(model_name), device="cpu" if quantize else None)
+        self.version = model_name
+        if quantize:
+            torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            self.version = f"{model_name}:int8"
+        self.embedding_dtype = np.dtype(embedding_dtype)
+        self._ner = ner
+        self.ner_batch_size = ner_batch_size
+        self.cache = cache
+        if chunk_tokens == 0:
+            chunk_tokens = self.model.max_seq_length - 2
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.pooling = pooling
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.job_classifier = job_classifier
+        self.chunk_version = f"{self.version}:{chunk_tokens}:{chunk_overlap}"
+
+    @property
+    def ner(self) -> CustomNER:
+        if self._ner is None:
+            self._ner = CustomNER()
+        return self._ner
 
-    def sentence_embedding(self, job_description: str, resumes: list[str]) -> list:
+    def sentence_embedding(self, job_description: str, resumes: list[str], keys: list[str] = None) -> list:
         """
         Generate sentence embeddings for the job description and resumes
 
         Args:
             job_description (str): Job description text
             resumes (list): List of resume texts
+            keys (list): Content digests of the resumes. When given, cached resume embeddings are reused.
 
         Returns:
             list: List of sentence embeddings.
         """
-        sentences = [job_description] + resumes
-        sentence_embeddings = self.model.encode(sentences)
-        return sentence_embeddings  # type: ignore
+        if not self.chunk_tokens and (self.cache is None or keys is None):
+            sentences = [job_description] + resumes
+            sentence_embeddings = self.model.encode(sentences, batch_size=self.batch_size)
+            return sentence_embeddings  # type: ignore
+
+        query = self.model.encode([job_description])
+        return np.vstack([query, self.resume_embeddings(resumes, keys, query[0])])
+
+    def _cached_encode(self, kind: str, version: str, texts: list[str], keys: list[str], encode) -> list:
+        """
+        Encode texts, reusing and filling the cache when keys are given
+
+        Args:
+            kind (str): Cache kind of the results
+            version (str): Version of the encoder settings
+            texts (list): Texts to encode
+            keys (list): Content digests of the texts
+            encode (callable): Function encoding a list of texts into a list of results
+
+        Returns:
+            list: One result per text
+        """
+        if self.cache is None or keys is None:
+            return list(encode(texts))
+
+        results = [self.cache.get(kind, key, version) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            for index, result in zip(missing, encode([texts[index] for index in missing])):
+                self.cache.set(kind, keys[index], version, result)
+                results[index] = result
+        return results
+
+    def chunk_text(self, text: str) -> list[str]:
+        """
+        Split a text into overlapping windows of at most `chunk_tokens` tokens
+
+        Args:
+            text (str): Resume text
+
+        Returns:
+            list: Text windows, cut at token boundaries of the original text
+        """
+        offsets = self.model.tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+        )["offset_mapping"]
+        if len(offsets) <= self.chunk_tokens:
+            return [text]
+        stride = max(1, self.chunk_tokens - self.chunk_overlap)
+        chunks = []
+        for start in range(0, len(offsets), stride):
+            window = offsets[start : start + self.chunk_tokens]
+            chunks.append(text[window[0][0] : window[-1][1]])
+            if start + self.chunk_tokens >= len(offsets):
+                break
+        return chunks
+
+    def _encode_chunks(self, texts: list[str]) -> list[np.ndarray]:
+        """
+        Encode the windows of all texts in one batched call. `SentenceTransformer.encode`
+        sorts its input by length, so windows of similar size share a padded batch.
+
+        Returns:
+            list: Window embeddings per text, each of shape (windows, dim)
+        """
+        chunked = [self.chunk_text(text) for text in texts]
+        encoded = self.model.encode(
+            [chunk for chunks in chunked for chunk in chunks], batch_size=self.batch_size
+        ).astype(self.embedding_dtype, copy=False)
+        bounds = np.cumsum([0] + [len(chunks) for chunks in chunked])
+        return [encoded[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def pool_chunks(self, chunk_embeddings: np.ndarray, query: np.ndarray = None) -> np.ndarray:
+        """
+        Pool the window embeddings of a resume into one embedding
+
+        Args:
+            chunk_embeddings (np.ndarray): Window embeddings of shape (windows, dim)
+            query (np.ndarray): Job description embedding. Required for 'top-n' pooling,
+                which falls back to 'mean' without it.
+
+        Returns:
+            np.ndarray: Pooled resume embedding
+        """
+        if self.pooling == "max":
+            return chunk_embeddings.max(axis=0)
+        if self.pooling == "top-n" and query is not None:
+            similarity = cosine_similarity([query], chunk_embeddings)[0]
+            best = np.argsort(-similarity)[: self.top_n]
+            return chunk_embeddings[best].mean(axis=0)
+        return chunk_embeddings.mean(axis=0)
+
+    @metrics.timed("ranker.encode")
+    def resume_embeddings(self, resumes: list[str], keys: list[str] = None, query: np.ndarray = None) -> np.ndarray:
+        """
+        Generate embeddings for the resumes, reusing cached embeddings when keys are given
+
+        Args:
+            resumes (list): List of resume texts
+            keys (list): Content digests of the resumes
+            query (np.ndarray): Job description embedding, used by 'top-n' chunk pooling
+
+        Returns:
+            np.ndarray: Resume embeddings, one row per resume
+        """
+        if self.chunk_tokens:
+            chunk_embeddings = self._cached_encode(
+                "chunk_embedding", self.chunk_version, resumes, keys, self._encode_chunks
+            )
+            embeddings = [self.pool_chunks(chunks.astype(np.float32, copy=False), query) for chunks in chunk_embeddings]
+        else:
+            embeddings = self._cached_encode(
+                "embedding",
+                self.version,
+                resumes,
+                keys,
+                lambda texts: self.model.encode(texts, batch_size=self.batch_size).astype(
+                    self.embedding_dtype, copy=False
+                ),
+            )
+        if not embeddings:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.vstack(embeddings).astype(np.float32, copy=False)
+
+    def add_to_pool(self, pool: CandidatePool, resumes: list[dict], index: IVFIndex = None) -> list[str]:
+        """
+        Encode resumes and store their embeddings in a candidate pool, with the entities,
+        links and job role needed to show them in a ranking. Resumes that were just ranked
+        are served from the cache.
+
+        Args:
+            pool (CandidatePool): Pool to add the resumes to
+            resumes (list): Processed resumes with 'text' and 'links', as returned by `PDF.process_pdf`
+            index (IVFIndex): Approximate index over the pool, updated with the new embeddings
+
+        Returns:
+            list: Candidate ids of the resumes in the pool
+        """
+        if not resumes:
+            return []
+        resume_text = [resume["text"] for resume in resumes]
+        keys = [resume.get("digest") or AnalysisCache.digest(resume["text"]) for resume in resumes]
+        embeddings = self.resume_embeddings(resume_text, keys)
+        entities = self.resume_entities(resume_text, keys)
+        roles = self.resume_roles(resume_text, keys)
+        metadata = []
+        for entity, role, resume in zip(entities, roles, resumes):
+            candidate = self._candidate(None, entity, resume["links"], role)
+            del candidate["match"]
+            metadata.append({**candidate, "filename": resume.get("filename")})
+        generation = pool.generation
+        pool.add(keys, embeddings, metadata)
+        if index is not None:
+            index.add(keys, embeddings)
+            # When no other change came in between, the index already matches the pool
+            if index.synced_generation == generation and pool.generation == generation + 1:
+                index.synced_generation = generation + 1
+        return keys
+
+    @metrics.timed("ranker.rank_pool")
+    def rank_pool(
+        self, job_description: str, pool: CandidatePool, top_k: int = None, index: IVFIndex = None
+    ) -> dict:
+        """
+        Rank the stored candidates of a pool against a job description. Only the job
+        description is encoded; the resumes are scored from their stored embeddings.
+
+        Args:
+            job_description (str): Job description text
+            pool (CandidatePool): Pool of stored candidates
+            top_k (int): Number of best candidates to return. All candidates when not given.
+            index (IVFIndex): Approximate index over the pool. When given, it is first synced with
+                the pool if the pool changed since, and only the approximate top-k candidates are
+                scored (top_k defaults to 10).
+
+        Returns:
+            dict: Dictionary of match scores and stored metadata with candidate ids as keys, best first
+        """
+        query = self.model.encode([job_description])[0]
+        if index is not None:
+            index.sync(pool)
+            matches = index.search(query, top_k or 10)
+        else:
+            matches = pool.search(query, top_k)
+        metadata = pool.get_metadata([candidate_id for candidate_id, _ in matches])
+        return {
+            candidate_id: {"match": round(score * 100, 2), **(meta or {})}
+            for (candidate_id, score), meta in zip(matches, metadata)
+        }
+
+    @metrics.timed("ranker.ner")
+    def resume_entities(self, resumes: list[str], keys: list[str] = None) -> list[dict]:
+        """
+        Run NER over the resumes, reusing cached entities when keys are given
+
+        Args:
+            resumes (list): List of resume texts
+            keys (list): Content digests of the resumes
+
+        Returns:
+            list: Entity dictionaries, in the same order as the resumes
+        """
+        if self.cache is None or keys is None:
+            return self.ner.process_texts(resumes, batch_size=self.ner_batch_size)
+
+        entities = [self.cache.get("ner", key, self.ner.version) for key in keys]
+        missing = [index for index, entity in enumerate(entities) if entity is None]
+        processed = self.ner.process_texts([resumes[index] for index in missing], batch_size=self.ner_batch_size)
+        for index, entity in zip(missing, processed):
+            self.cache.set("ner", keys[index], self.ner.version, entity)
+            entities[index] = entity
+        return entities
+
+    @metrics.timed("ranker.job_role")
+    def resume_roles(self, resumes: list[str], keys: list[str] = None) -> list[str]:
+        """
+        Predict the job role of every resume in one batch, reusing cached roles when keys are given
+
+        Args:
+            resumes (list): List of resume texts
+            keys (list): Content digests of the resumes
+
+        Returns:
+            list: Predicted job role per resume, or None per resume when there is no job classifier
+        """
+        if self.job_classifier is None:
+            return [None] * len(resumes)
+        return self._cached_encode(
+            "job_role", self.job_classifier.version, resumes, keys, self.job_classifier.predict_job_roles
+        )
 
     def calculate_similarity_score(self, sentence_embeddings: list) -> list:
         """
@@ -49,6 +348,67 @@ class ResumeRanker:
         similarity_scores = cosine_similarity([sentence_embeddings[0]], sentence_embeddings[1:])[0]  # type: ignore
         return [round(float(score) * 100, 2) for score in similarity_scores]
 
+    def _candidate(self, match: float, entities: dict, links: list, job_role: str = None) -> dict:
+        """
+        Build the ranking entry of a single resume
+
+        Args:
+            match (float): Similarity score of the resume
+            entities (dict): NER entities of the resume
+            links (list): Hyperlinks found in the resume PDF
+            job_role (str): Predicted job role of the resume
+
+        Returns:
+            dict: Dictionary with the match score, entities, links, GitHub usernames and job role
+        """
+        candidate = {"match": match, "ner": entities, "links": links, "github": []}
+        if job_role is not None:
+            candidate["job_role"] = job_role
+        if "link" in entities:
+            candidate["links"] = entities["link"] + links
+
+        for link in candidate["links"]:
+            match = re.match(r"https?://(?:www\.)?github\.com/([^/]+)/?", link)
+            if match:
+                username = match.group(1)
+                candidate["github"].append(username)
+        return candidate
+
+    def iter_similarity(self, job_description: str, resumes, batch_size: int = 8):
+        """
+        Score resumes in batches, yielding every candidate as soon as its batch is processed
+
+        Args:
+            job_description (str): Job description text.
+            resumes (iterable): Processed resumes with 'text' and 'links'. May be a lazy iterable.
+            batch_size (int): Number of resumes embedded and run through NER together. Defaults to 8.
+
+        Yields:
+            tuple: ('candidate', index, entry) for every resume in input order, followed by
+                ('ranking', None, ranking) with the final ranking as returned by `get_similarity`.
+        """
+        resumes = iter(resumes)
+        query = self.model.encode([job_description])[0]
+        candidates = {}
+        while True:
+            batch = list(islice(resumes, batch_size))
+            if not batch:
+                break
+            resume_text = [resume["text"] for resume in batch]
+            keys = [resume.get("digest") or AnalysisCache.digest(resume["text"]) for resume in batch]
+            embeddings = self.resume_embeddings(resume_text, keys, query)
+            scores = self.calculate_similarity_score(np.vstack([query, embeddings]))
+            entities = self.resume_entities(resume_text, keys)
+            roles = self.resume_roles(resume_text, keys)
+            for score, entity, role, resume in zip(scores, entities, roles, batch):
+                index = len(candidates) + 1
+                candidates[index] = self._candidate(score, entity, resume["links"], role)
+                yield "candidate", index, candidates[index]
+
+        ranking = dict(sorted(candidates.items(), key=lambda item: item[1]["match"], reverse=True))
+        yield "ranking", None, ranking
+
+    @metrics.timed("ranker.get_similarity")
     def get_similarity(self, job_description: str, resumes: list[dict]) -> dict:
         """
         Get the similarity scores between the job description and resumes.
@@ -60,28 +420,6 @@ class ResumeRanker:
         Returns:
             dict: Dictionary containing similarity scores with resume indices as keys.
         """
-        resume_text = [resume["text"] for resume in resumes]
-        sentence_embeddings = self.sentence_embedding(job_description, resume_text)
-        scores = self.calculate_similarity_score(sentence_embeddings)
-
-        scores = {index + 1: item for index, item in enumerate(scores)}
-        scores = {
-            k: {
-                "match": v,
-                "ner": CustomNER().process_text(resume_text[k - 1]),
-                "links": resumes[k - 1]["links"],
-            }
-            for k, v in sorted(scores.items(), key=lambda item: item[1], reverse=True)
-        }
-
-        for key, value in scores.items():
-            scores[key]["github"] = []
-            if "link" in value["ner"]:
-                scores[key]["links"] = value["ner"]["link"] + value["links"]
-
-            for link in value["links"]:
-                match = re.match(r"https?://(?:www\.)?github\.com/([^/]+)/?", link)
-                if match:
-                    username = match.group(1)
-                    scores[key]["github"].append(username)
-        return scores
+        for _, _, ranking in self.iter_similarity(job_description, resumes, batch_size=max(len(resumes), 1)):
+            pass
+        return ranking